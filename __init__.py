@@ -7,10 +7,21 @@ License: BSD-2-Clause
 '''
 
 import os
+import re
 import sys
+import json
+import threading
+from contextlib import contextmanager
 import pymol
 from pymol import cmd
 from .legacysupport import *
+from . import tracing
+from . import metrics
+from . import profiling
+from .registry import PluginRegistry, intern_metadata
+from . import archives
+from .pluginfile import parse_metadata, parse_docstring, write_file_atomic
+from .installation import get_default_user_plugin_path
 
 # variables
 
@@ -21,7 +32,10 @@ preferences = {
 
 autoload = {}
 
-plugins = {}
+plugins = PluginRegistry()
+
+# True after loadPlugins has been called
+plugins_registered = False
 
 # API functions
 
@@ -35,53 +49,306 @@ def get_startup_path():
     return startup.__path__
 
 def set_startup_path(p, autosave=True):
+    '''
+    Set the plugin search path. If plugins have been registered already,
+    rescan for added and removed plugins.
+    '''
     if isinstance(p, list) and len(p) > 0:
         startup.__path__ = p
         if autosave:
             set_pref_changed()
+        if plugins_registered:
+            rescan(pmgapp=None)
     else:
         print ' Error: set_startup_path failed'
 
 def pref_set(k, v):
+    pref_load_namespace(k)
     preferences[k] = v
     set_pref_changed()
 
 def pref_get(k, d=None):
+    if '.' in k:
+        pref_load_namespace(k)
     return preferences.get(k, d)
 
-def pref_save(filename='~/.pymolrc_plugins.py', quiet=1):
-    import pprint
-    repr = pprint.pformat
+# Preferences are stored as JSON. Keys with a "namespace." prefix (like
+# "hello.foo") are stored in one file per namespace, which is only read when
+# a key of that namespace is accessed first.
+
+PREF_VERSION = 1
+
+# legacy resource file (executed python code)
+pref_legacy_filename = '~/.pymolrc_plugins.py'
+
+_pref_namespaces = {}   # namespace -> dict as loaded from or saved to disk
+
+def get_pref_filename(namespace=None):
+    '''
+    Main preferences file is ~/.pymol/plugin_prefs.json, namespaced
+    preferences go to ~/.pymol/plugin_prefs/<namespace>.json
+    '''
+    dirname = os.path.dirname(get_default_user_plugin_path())
+    if namespace is None:
+        return os.path.join(dirname, 'plugin_prefs.json')
+    return os.path.join(dirname, 'plugin_prefs', namespace + '.json')
+
+def get_pref_namespace(k):
+    '''
+    Return namespace of preference key (prefix before the first dot), or None
+    if the key is not namespaced.
+    '''
+    m = re.match(r'([-\w]+)\.', k)
+    if m is None:
+        return None
+    return m.group(1)
 
+def _read_json(filename):
+    f = open(filename)
     try:
-        f = open(cmd.exp_path(filename), 'w')
-    except IOError:
-        print ' Plugin-Error: Cannot write Plugins resource file to', filename
+        return _str_recursive(json.load(f))
+    finally:
+        f.close()
+
+def _str_recursive(obj):
+    '''
+    Convert unicode objects (as returned by json) to utf-8 encoded str
+    '''
+    if isinstance(obj, unicode):
+        return obj.encode('utf-8')
+    if isinstance(obj, list):
+        return [_str_recursive(x) for x in obj]
+    if isinstance(obj, dict):
+        return dict((_str_recursive(k), _str_recursive(v))
+                for (k, v) in obj.iteritems())
+    return obj
+
+def _write_json(filename, data):
+    dirname = os.path.dirname(filename)
+    if not os.path.exists(dirname):
+        os.makedirs(dirname)
+    write_file_atomic(filename, json.dumps(data, sort_keys=True,
+        separators=(',', ':')))
+
+def pref_load_namespace(k):
+    '''
+    Load the preferences file of the namespace of key "k", if not loaded
+    yet. Values already set in this session take precedence.
+    '''
+    namespace = get_pref_namespace(k)
+    if namespace is None or namespace in _pref_namespaces:
         return
 
-    print >> f, '# AUTOGENERATED FILE'
-    print >> f, 'try:'
-    print >> f, '  import', __name__
-    print >> f, '  ' + __name__ + '.autoload =', repr(autoload)
-    print >> f, '  ' + __name__ + '.preferences =', repr(preferences)
-    print >> f, '  ' + __name__ + '.set_startup_path(', repr(get_startup_path()), ', False)'
-    print >> f, 'except:'
-    print >> f, '  import os'
-    print >> f, '  print "Error while loading " + os.path.abspath(__script__)'
-    f.close()
+    data = {}
+    filename = get_pref_filename(namespace)
+    if os.path.exists(filename):
+        try:
+            data = _read_json(filename)
+        except (IOError, ValueError):
+            print ' Plugin-Error: Cannot read preferences from', filename
+
+    _pref_namespaces[namespace] = data
+    for key, value in data.iteritems():
+        preferences.setdefault(key, value)
+
+def pref_load(filename=None):
+    '''
+    Load autoload flags, global preferences and startup path. Namespaced
+    preferences are loaded on demand (see pref_load_namespace).
+
+    If no preferences file exists yet, migrate settings from the legacy
+    resource file (~/.pymolrc_plugins.py).
+    '''
+    if filename is None:
+        filename = get_pref_filename()
+
+    if not os.path.exists(filename):
+        _pref_migrate(filename)
+        return
+
+    try:
+        data = _read_json(filename)
+        if data.get('version') != PREF_VERSION:
+            raise ValueError('unknown version')
+    except (IOError, ValueError):
+        print ' Plugin-Error: Cannot read preferences from', filename
+        return
+
+    autoload.update(data.get('autoload', {}))
+    preferences.update(data.get('preferences', {}))
+    if data.get('startup_path'):
+        set_startup_path(data['startup_path'], False)
+
+def _pref_migrate(filename):
+    '''
+    Execute legacy resource file, save its settings in the new format, and
+    replace it with a stub (PyMOL still runs ~/.pymolrc* files on startup).
+    '''
+    legacy_filename = cmd.exp_path(pref_legacy_filename)
+    if not os.path.exists(legacy_filename):
+        return
+
+    try:
+        execfile(legacy_filename, {'__script__': legacy_filename})
+    except Exception:
+        print ' Plugin-Error: Cannot migrate preferences from', legacy_filename
+        return
+
+    # all namespaces are in memory now
+    for k in preferences:
+        namespace = get_pref_namespace(k)
+        if namespace is not None:
+            _pref_namespaces.setdefault(namespace, {})
+
+    pref_save(filename)
+
+    try:
+        write_file_atomic(legacy_filename, '# AUTOGENERATED FILE\n'
+                '# Plugin settings have been moved to ' + filename + '\n')
+    except (IOError, OSError):
+        pass
+
+def pref_save(filename=None, quiet=1):
+    '''
+    Write autoload flags, global preferences and startup path to the
+    preferences file, and namespaced preferences to one file per loaded
+    namespace (only if modified). Files are replaced atomically.
+    '''
+    if filename is None:
+        filename = get_pref_filename()
+    else:
+        filename = cmd.exp_path(filename)
+
+    # make sure that stored values of all used namespaces are in memory
+    for k in list(preferences):
+        pref_load_namespace(k)
+
+    # copies, dictionaries may be modified by other threads. No I/O or
+    # imports under _pref_lock: the import lock may be held by a thread
+    # which waits for _pref_lock (pref_set at plugin import time).
+    with _pref_lock:
+        current_prefs = dict(preferences)
+        current_autoload = dict(autoload)
+        startup_path = list(get_startup_path())
+        saved_namespaces = dict(_pref_namespaces)
+
+    global_prefs = {}
+    namespaces = {}
+    for k, v in current_prefs.iteritems():
+        namespace = get_pref_namespace(k)
+        if namespace is None:
+            global_prefs[k] = v
+        else:
+            namespaces.setdefault(namespace, {})[k] = v
+
+    data = {
+        'version': PREF_VERSION,
+        'autoload': current_autoload,
+        'preferences': global_prefs,
+        'startup_path': startup_path,
+    }
+
+    try:
+        with tracing.span('pref_save', 'prefs'):
+            _write_json(filename, data)
+            metrics.counter('pref_writes_total', 'Preference file writes').inc()
+
+            for namespace, saved in saved_namespaces.iteritems():
+                current = namespaces.get(namespace, {})
+                if current == saved:
+                    continue
+                ns_filename = get_pref_filename(namespace)
+                if current:
+                    _write_json(ns_filename, current)
+                    metrics.counter('pref_writes_total', 'Preference file writes').inc()
+                elif os.path.exists(ns_filename):
+                    os.remove(ns_filename)
+                _pref_namespaces[namespace] = current
+    except (IOError, OSError, TypeError, ValueError):
+        print ' Plugin-Error: Cannot write Plugins preferences to', filename
+        return
 
     if not int(quiet):
         print ' Plugin settings saved!'
 
+# state for delayed and batched saving of preferences
+_pref_lock = threading.RLock()
+_pref_timer = None
+_pref_changed = False
+_pref_batch_depth = 0
+
 def set_pref_changed():
+    '''
+    Mark preferences as modified. In "instantsave" mode, saving is scheduled
+    with a delay of "pref_save_delay" seconds (so that subsequent changes
+    result in a single write), or postponed until the end of a pref_batch()
+    block.
+    '''
+    global _pref_changed
+    metrics.counter('pref_changes_total', 'Preference changes').inc()
     if pref_get('instantsave', True):
-        verbose = pref_get('verbose', False)
-        pref_save(quiet=not verbose)
+        _pref_changed = True
+        if _pref_batch_depth == 0:
+            _pref_schedule_save()
+
+def _pref_schedule_save():
+    global _pref_timer
+    delay = pref_get('pref_save_delay', 0.5)
+    if delay <= 0:
+        pref_flush()
+        return
+    with _pref_lock:
+        if _pref_timer is None:
+            _pref_timer = threading.Timer(delay, pref_flush)
+            _pref_timer.setDaemon(1)
+            _pref_timer.start()
+
+def pref_flush():
+    '''
+    Save preferences now if there are unsaved changes.
+    '''
+    global _pref_changed, _pref_timer
+    with _pref_lock:
+        if _pref_timer is not None:
+            _pref_timer.cancel()
+            _pref_timer = None
+        if not _pref_changed:
+            return
+        _pref_changed = False
+    verbose = pref_get('verbose', False)
+    pref_save(quiet=not verbose)
+
+@contextmanager
+def pref_batch():
+    '''
+    Context manager which postpones saving of preferences until the end of
+    the (outermost) block.
+
+    Example:
+    with pref_batch():
+        for info in plugins.values():
+            info.autoload = True
+    '''
+    global _pref_batch_depth
+    _pref_batch_depth += 1
+    try:
+        yield
+    finally:
+        _pref_batch_depth -= 1
+        if _pref_batch_depth == 0 and _pref_changed:
+            _pref_schedule_save()
+
+import atexit
+atexit.register(pref_flush)
 
 def addmenuitem(label, command=None, menuName='Plugin'):
     '''
     Generic replacement for MegaWidgets menu item adding
     '''
+    with tracing.span('addmenuitem ' + label, 'menu'):
+        _addmenuitem(label, command, menuName)
+
+def _addmenuitem(label, command, menuName):
     labels1 = [menuName] + label.split('|')
     labels2 = ['|'.join(labels1[0:i]) for i in range(1, len(labels1))]
     pmgapp = get_pmgapp()
@@ -97,24 +364,249 @@ def addmenuitem(label, command=None, menuName='Plugin'):
             pmgapp.menuBar.addmenuitem(labels2[-1], 'command', label=labels1[-1],
                     command=command)
 
-def plugin_load(name, quiet=1):
+            # remember menu item, so it can be removed on reload
+            info = get_loading_plugin()
+            if info is not None:
+                info.menuitems.append((label, menuName))
+
+def delmenuitem(label, menuName='Plugin'):
+    '''
+    Remove a menu item which was added with addmenuitem. Empty cascade menus
+    are not removed.
+    '''
+    labels1 = [menuName] + label.split('|')
+    menuPath = '|'.join(labels1[:-1])
+    pmgapp = get_pmgapp()
+    try:
+        menu = pmgapp.menuBar.component(menuPath + '-menu')
+        index = menu.index(labels1[-1])
+    except Exception:
+        # no such menu or item, or not a Pmw.MenuBar (no GUI)
+        return False
+    pmgapp.menuBar.deletemenuitems(menuPath, index)
+    return True
+
+def unextend(name):
+    '''
+    Remove a command which was added with cmd.extend, including its
+    autocompletion entries.
+    '''
+    cmd.keyword.pop(name, None)
+    for auto_arg in cmd.auto_arg:
+        auto_arg.pop(name, None)
+    kwhash = getattr(cmd, 'kwhash', None)
+    if hasattr(kwhash, 'rebuild'):
+        kwhash.rebuild(cmd.keyword.keys())
+    plugins.remove_command(name)
+
+def get_plugin_tags(info):
+    '''
+    Tags of a plugin from the "Tags" metadata field (comma or space
+    separated), lower case.
+    '''
+    try:
+        v = info.get_metadata().get('Tags', '')
+    except IOError:
+        return []
+    return v.lower().replace(',', ' ').split()
+
+def resolve_plugin_names(spec, quiet=0):
+    '''
+    Resolve a plugin specification to a sorted list of registered plugin
+    names. The specification is a comma, "+" or space separated list of:
+
+    name            plugin name
+    pattern         glob pattern, e.g. struct_*
+    tag:name        plugins with this tag (metadata "Tags" field)
+    profile:name    plugins from a load profile ("load_profiles" preference,
+                    a dictionary {profile name: list of names or patterns}),
+                    or profile:autoload for all autoload plugins
+
+    Unknown names and patterns without matches are reported (unless quiet).
+    '''
+    import fnmatch
+
+    names = set()
+    tokens = spec.replace(',', ' ').replace('+', ' ').split()
+    profiles = pref_get('load_profiles', {})
+    profiles_seen = set()
+
+    while tokens:
+        token = tokens.pop(0)
+        kind, _, value = token.rpartition(':')
+        if kind == 'tag':
+            matches = [name for (name, info) in plugins.items()
+                    if value.lower() in get_plugin_tags(info)]
+        elif kind == 'profile':
+            if value == 'autoload':
+                matches = [name for (name, info) in plugins.items()
+                        if info.autoload]
+            elif value in profiles:
+                if value not in profiles_seen:
+                    profiles_seen.add(value)
+                    tokens.extend(profiles[value])
+                continue
+            else:
+                matches = []
+        elif kind:
+            matches = []
+        elif token in plugins:
+            matches = [token]
+        else:
+            matches = fnmatch.filter(plugins.keys(), token)
+
+        if not matches and not int(quiet):
+            print ' Error: no such plugin "%s"' % (token)
+        names.update(matches)
+
+    return sorted(names)
+
+def format_load_results(results):
+    '''
+    Format results of plugin_load as a table. Returns a list of lines.
+    '''
+    lines = [' %-24s %-8s %9s %9s %9s  %s' % ('plugin', 'status',
+        'total[s]', 'import[s]', 'init[s]', 'error')]
+    for r in results:
+        times = ' '.join(('%9.3f' % r[k]) if r[k] is not None else '%9s' % '-'
+                for k in ('total', 'import', 'init'))
+        lines.append((' %-24s %-8s %s  %s' % (r['name'], r['status'], times,
+            r['error'] or '')).rstrip())
+    return lines
+
+def split_name_arguments(name, args):
+    '''
+    The PyMOL command line splits arguments at commas, so with
+    "plugin_load a, b" the "b" arrives as the second argument. Leading
+    arguments which are not numbers (or None for unset defaults) are joined
+    into the name specification.
+
+    Returns (spec, remaining arguments)
+    '''
+    args = list(args)
+    names = [name]
+    while args and isinstance(args[0], basestring) and \
+            not args[0].strip().lstrip('-').isdigit():
+        names.append(args.pop(0))
+    return ' '.join(n.strip() for n in names), args
+
+def plugin_load(name, quiet=None, *more):
     '''
 DESCRIPTION
 
-    Load plugin from command line.
+    Load one or more plugins from command line. Plugins are given by name,
+    glob pattern, tag or load profile (see below). Plugins are loaded in
+    dependency order.
+
+    If more than one plugin is requested, a summary with per-plugin timing
+    and errors is printed.
+
+USAGE
+
+    plugin_load name [, name ...] [, quiet ]
+
+ARGUMENTS
+
+    name = string: comma, space or + separated list of:
+        plugin name
+        glob pattern (e.g. struct_*)
+        tag:name (plugins with this tag in the "Tags" metadata field)
+        profile:name (names or patterns from the "load_profiles" preference)
+        profile:autoload (all plugins with "load on startup")
+
+EXAMPLE
+
+    plugin_load struct_* tag:electrostatics
+
+PYMOL API
+
+    cmd.plugin_load(string name, int quiet=1)
+
+    Returns a list of dictionaries (name, status, total, import, init, error)
     '''
-    if name not in plugins:
-        print ' Error: no such plugin'
-        return
-    info = plugins[name]
-    if info.loaded:
-        if not int(quiet):
+    name, args = split_name_arguments(name, (quiet,) + more)
+    quiet = args[0] if args else None
+
+    quiet = int(1 if quiet is None else quiet)
+    names = resolve_plugin_names(name)
+    infos = [plugins[n] for n in names]
+    todo = [info for info in infos if not info.loaded]
+
+    if len(infos) == 1 and not todo:
+        if not quiet:
             print ' info: plugin already loaded'
-        return
-    info.load()
+
+    loaded = loadPluginsByRequires(todo, None)
+
+    status = dict((info.name, 'already') for info in infos)
+    for info, success in loaded:
+        status[info.name] = 'loaded' if success else 'failed'
+
+    results = []
+    for info in sorted(set(infos) | set(info for (info, _) in loaded),
+            key=lambda info: info.name):
+        results.append({
+            'name': info.name,
+            'status': status[info.name],
+            'total': info.loadtime,
+            'import': info.importtime,
+            'init': info.inittime,
+            'error': info.error if status[info.name] == 'failed' else None,
+        })
+
+    if len(results) > 1 or (todo and not quiet):
+        for line in format_load_results(results):
+            print line
+
+    return results
 
 # helper functions and classes
 
+# stack (per thread) of plugins which are currently loading, to attribute
+# commands registered with cmd.extend to the right plugin
+_loading = threading.local()
+
+def get_loading_plugin():
+    '''
+    Returns the PluginInfo instance which is currently loading in this
+    thread, or None.
+    '''
+    stack = getattr(_loading, 'stack', None)
+    if stack:
+        return stack[-1]
+    return None
+
+def push_loading_plugin(info):
+    if not hasattr(_loading, 'stack'):
+        _loading.stack = []
+    _loading.stack.append(info)
+
+def pop_loading_plugin():
+    _loading.stack.pop()
+
+def _extend_tracked(name, function=None, *args, **kwargs):
+    '''
+    Wrapper for cmd.extend which registers the command with the plugin that
+    is currently loading in this thread, or (commands added later, e.g. from
+    a menu callback) with the plugin which owns the calling source file.
+    '''
+    if function is None:
+        # decorator usage
+        r = _extend_orig(name, *args, **kwargs)
+        name = getattr(name, '__name__', name)
+    else:
+        r = _extend_orig(name, function, *args, **kwargs)
+    info = get_loading_plugin()
+    if info is None:
+        info = plugins.find_by_file(sys._getframe(1).f_code.co_filename)
+        if info is not None and not info.loaded:
+            info = None
+    if info is not None:
+        if name not in info.commands:
+            info.commands.append(name)
+        plugins.add_command(name, info)
+    return r
+
 class PluginInfo(object):
     '''
     Hold all information about a plugin.
@@ -122,14 +614,33 @@ class PluginInfo(object):
     A instance with mod_name=None is considered a temporary instance which
     cannot be loaded (during installation, for extraction of metadata, ...)
     '''
+    # many instances on site installs, avoid per-instance __dict__
+    __slots__ = ['name', 'mod_name', 'filename', '_metadata',
+            'importtime', 'inittime', 'loadtime', 'commands', 'menuitems',
+            'modules', 'mtimes', 'initialized', 'memory', 'error', 'stubs',
+            '_record']
+
     def __init__(self, name, filename, mod_name=None):
         self.name = name
         self.mod_name = mod_name
         self.filename = filename
+        self._metadata = None
+        self._record = None
 
         # set on loading
+        self.importtime = None
+        self.inittime = None
         self.loadtime = None
         self.commands = []
+        self.menuitems = []
+        self.modules = []
+        self.mtimes = {}
+        self.initialized = False
+        self.memory = None
+        self.error = None
+
+        # set by load_lazy
+        self.stubs = []
 
         # register
         if not self.is_temporary:
@@ -163,19 +674,25 @@ class PluginInfo(object):
         '''
         Parse plugin file for metadata (hash-commented block at beginning of file).
         '''
-        metadata = dict()
-        f = open(self.filename)
-        for line in f:
-            if line.strip() == '':
-                continue
-            if not line.startswith('#'):
-                break
-            if ':' in line:
-                key, value = line[1:].split(':', 1)
-                metadata[key.strip()] = value.strip()
-        f.close()
-        self.get_metadata = lambda: metadata
-        return metadata
+        if self._metadata is not None:
+            return self._metadata
+
+        record = self.get_index_record()
+        metadata = record.get('metadata')
+        if not self.is_temporary:
+            metrics.counter('index_lookups_total', 'Plugin index lookups'
+                    ).inc(kind='metadata', hit=str(metadata is not None))
+
+        if metadata is None:
+            with tracing.span('metadata ' + self.name, 'metadata'):
+                f = archives.open_file(self.filename)
+                metadata = parse_metadata(f)[0]
+                f.close()
+            record['metadata'] = metadata
+            self.set_index_changed()
+
+        self._metadata = intern_metadata(metadata)
+        return self._metadata
 
     def get_version(self):
         '''
@@ -203,61 +720,280 @@ class PluginInfo(object):
         if self.loaded:
             return self.module.__doc__
 
+        record = self.get_index_record()
+        if 'docstring' in record:
+            return record['docstring']
+
         try:
-            c = compile(''.join(open(self.filename)), 'x', 'single')
-            s = c.co_consts[0]
-            if isinstance(s, basestring):
-                return s
-        except:
-            pass
+            f = archives.open_file(self.filename)
+            try:
+                docstring = parse_docstring(f.read())[0]
+            finally:
+                f.close()
+        except IOError:
+            docstring = None
+
+        record['docstring'] = docstring
+        self.set_index_changed()
+        return docstring
+
+    def get_index_record(self):
+        '''
+        Get the plugin index record (dict) for this plugin's file. Temporary
+        instances get a non-persistent record.
+        '''
+        if self.is_temporary:
+            if self._record is None:
+                self._record = {}
+            return self._record
+        from .index import get_index
+        return get_index().get_record(self.filename)
+
+    def set_index_changed(self):
+        if not self.is_temporary:
+            from .index import get_index
+            get_index().set_changed()
 
     def load(self, pmgapp=None, force=0):
         '''
         Load and initialize plugin.
 
         If pmgapp == -1, do not initialize.
-        '''
-        import time
 
+        Plugins listed in the "Requires" metadata field are loaded first.
+        '''
         assert not self.is_temporary
 
-        starttime = time.time()
         if pmgapp is None:
             pmgapp = get_pmgapp()
 
-        verbose = pref_get('verbose', False)
+        for group in sortPluginsByRequires([self]):
+            for info in group:
+                if info is not self:
+                    info.load_import() and info.load_init(pmgapp)
+
+        return self.load_import(force) and self.load_init(pmgapp)
+
+    def load_import(self, force=0):
+        '''
+        First loading phase: Import the plugin module. Commands are
+        attributed to this plugin by the cmd.extend wrapper.
+        '''
+        import time
+
+        starttime = time.time()
+        # do not use self.loaded here
+        reloading = force and self.module is not None
+        if reloading:
+            # commands and menu items of the old version
+            self.unregister()
+        self.commands = []
+        self.memory = None
+        self.error = None
+        modules_before = set(sys.modules)
 
+        push_loading_plugin(self)
         try:
-            # overload cmd.extend to register commands
-            extend_orig = cmd.extend
-            def extend_overload(name, function):
-                extend_orig(name, function)
-                self.commands.append(name)
-            cmd.extend = extend_overload
-
-            # do not use self.loaded here
-            if force and self.module is not None:
-                reload(self.module)
-            else:
-                __import__(self.mod_name, level=0)
+            with tracing.span('import ' + self.name, 'import'), \
+                    profiling.measure_memory(self):
+                if reloading:
+                    reload(self.module)
+                else:
+                    __import__(self.mod_name, level=0)
+        except:
+            self.load_failed()
+            return False
+        finally:
+            pop_loading_plugin()
+
+        self.importtime = time.time() - starttime
+        metrics.histogram('plugin_import_seconds', 'Plugin import time'
+                ).observe(self.importtime, plugin=self.name)
 
-            if pmgapp != -1:
+        # modules which were pulled in by this plugin (only accurate if
+        # plugins are imported serially)
+        self.modules = sorted(name for name in set(sys.modules) - modules_before
+                if sys.modules[name] is not None)
+        self.mtimes = self.get_module_mtimes()
+
+        return True
+
+    def load_init(self, pmgapp):
+        '''
+        Second loading phase: Initialize the imported plugin (unless
+        pmgapp == -1). Must be called from the main thread.
+        '''
+        import time
+
+        starttime = time.time()
+
+        if pmgapp != -1:
+            try:
                 self.legacyinit(pmgapp)
+            except:
+                self.load_failed()
+                return False
+
+        self.inittime = time.time() - starttime
+        self.loadtime = self.importtime + self.inittime
+        metrics.counter('plugins_loaded_total', 'Successfully loaded plugins').inc()
+        metrics.histogram('plugin_load_seconds', 'Plugin load time (import and initialization)'
+                ).observe(self.loadtime, plugin=self.name)
+        self.stubs = []
+        self.set_cached_commands()
+        if pref_get('verbose', False) and pymol.invocation.options.show_splash:
+            print ' Plugin "%s" loaded in %.2f seconds' % (self.name, self.loadtime)
 
-            cmd.extend = extend_orig
+        return True
 
-            self.loadtime = time.time() - starttime
-            if verbose and pymol.invocation.options.show_splash:
-                print ' Plugin "%s" loaded in %.2f seconds' % (self.name, self.loadtime)
-        except:
-            if verbose:
-                import traceback
-                traceback.print_exc()
-            print "Unable to initialize plugin '%s' (%s)." % (self.name, self.mod_name)
+    def load_failed(self):
+        import traceback
+        exc_type, exc_value = sys.exc_info()[:2]
+        self.error = ''.join(traceback.format_exception_only(exc_type,
+            exc_value)).strip()
+        metrics.counter('plugins_failed_total', 'Plugins which failed to load'
+                ).inc()
+        if pref_get('verbose', False):
+            traceback.print_exc()
+        print "Unable to initialize plugin '%s' (%s)." % (self.name, self.mod_name)
+        culprit = plugins.find_by_traceback(sys.exc_info()[2])
+        if culprit is not None and culprit is not self:
+            print " The error was raised in plugin '%s'." % (culprit.name)
+
+    def get_requires(self):
+        '''
+        Get the names of plugins which must be loaded before this plugin,
+        from the "Requires" metadata field (comma or space separated).
+        '''
+        try:
+            v = self.get_metadata().get('Requires', '')
+        except IOError:
+            return []
+        return v.replace(',', ' ').split()
+
+    def has_legacyinit(self):
+        '''
+        True if the loaded module has an initialization function, see
+        legacyinit.
+        '''
+        import types
+        mod = self.module
+        return hasattr(mod, '__init_plugin__') or \
+                isinstance(getattr(mod, '__init__', None), types.FunctionType)
+
+    def get_cached_commands(self):
+        '''
+        Get the commands which were registered when this plugin was loaded
+        the last time, as a list of (name, auto_args) tuples, with auto_args
+        being a list of (index, label, postfix) tuples. The list is only
+        available if the plugin file did not change since then.
+
+        Returns None if unknown or if the plugin has an initialization
+        function (which usually adds menu items).
+        '''
+        record = self.get_index_record()
+        if record.get('has_init', True):
+            return None
+        return record.get('commands')
+
+    def set_cached_commands(self):
+        '''
+        Store the commands of the loaded plugin (and their autocompletion
+        entries) in the plugin index.
+        '''
+        commands = []
+        for name in self.commands:
+            auto_args = []
+            for i, auto_arg in enumerate(cmd.auto_arg):
+                entry = auto_arg.get(name)
+                if entry is not None and len(entry) > 2:
+                    auto_args.append((i, str(entry[1]), str(entry[2])))
+            commands.append((name, auto_args))
+
+        record = self.get_index_record()
+        record['commands'] = commands
+        record['has_init'] = self.has_legacyinit()
+        self.set_index_changed()
+
+    def load_lazy(self):
+        '''
+        Register stub commands (and autocompletion entries) instead of
+        loading the plugin. The plugin gets loaded when one of its commands
+        is called for the first time.
+
+        Returns False if the commands of this plugin are unknown, or if it
+        has an initialization function (those plugins can't be deferred).
+        '''
+        if self.loaded:
+            return True
+
+        commands = self.get_cached_commands()
+        if not commands:
             return False
 
+        for name, auto_args in commands:
+            cmd.extend(name, self._make_stub(name))
+            for (i, label, postfix) in auto_args:
+                if i < len(cmd.auto_arg):
+                    cmd.auto_arg[i][name] = [self._make_stub_sc(i, name),
+                            label, postfix]
+
+        self.stubs = [name for (name, _) in commands]
+        for name in self.stubs:
+            plugins.add_command(name, self)
+
+        if is_verbose(1):
+            print ' Plugin "%s" will be loaded on first use' % (self.name)
+
         return True
 
+    def remove_stubs(self):
+        '''
+        Remove the stub commands which were registered by load_lazy.
+        '''
+        for name in self.stubs:
+            unextend(name)
+        self.stubs = []
+
+    def _make_stub(self, name):
+        '''
+        Stub function for command "name" which loads the plugin and then
+        calls the actual command.
+        '''
+        def stub(*args, **kwargs):
+            if not self.loaded:
+                self.load()
+            entry = cmd.keyword.get(name)
+            if entry is None or entry[0] is stub:
+                print ' Error: plugin "%s" does not provide command "%s"' % \
+                        (self.name, name)
+                return
+            return entry[0](*args, **kwargs)
+        stub.__name__ = name
+        stub.__doc__ = '''
+DESCRIPTION
+
+    Command "%s" from plugin "%s" (not loaded yet).
+    ''' % (name, self.name)
+        return stub
+
+    def _make_stub_sc(self, i, name):
+        '''
+        Stub autocompletion callback, loads the plugin and returns the actual
+        shortcut object.
+        '''
+        def stub_sc():
+            if not self.loaded:
+                self.load()
+            entry = cmd.auto_arg[i].get(name)
+            if entry is None or entry[0] is stub_sc:
+                return cmd.Shortcut([])
+            sc = entry[0]
+            if callable(sc):
+                sc = sc()
+            return sc
+        return stub_sc
+
     def legacyinit(self, pmgapp):
         '''
         Call the __init__ or __init_plugin__ function which takes the PMGApp
@@ -276,17 +1012,180 @@ class PluginInfo(object):
         if mod is None:
             raise RuntimeError('not loaded')
 
-        if hasattr(mod, '__init_plugin__'):
-            mod.__init_plugin__(pmgapp)
-        elif hasattr(mod, '__init__'):
-            if isinstance(mod.__init__, types.FunctionType):
-                mod.__init__(pmgapp)
+        push_loading_plugin(self)
+        try:
+            with tracing.span('legacyinit ' + self.name, 'init'), \
+                    profiling.measure_memory(self):
+                if hasattr(mod, '__init_plugin__'):
+                    mod.__init_plugin__(pmgapp)
+                elif hasattr(mod, '__init__'):
+                    if isinstance(mod.__init__, types.FunctionType):
+                        mod.__init__(pmgapp)
+        finally:
+            pop_loading_plugin()
+
+        self.initialized = True
+
+    def unregister(self):
+        '''
+        Remove the commands and menu items which were added by this plugin.
+        '''
+        for name in self.commands:
+            unextend(name)
+        for (label, menuName) in self.menuitems:
+            delmenuitem(label, menuName)
+        self.commands = []
+        self.menuitems = []
+
+    def unload(self):
+        '''
+        Unload plugin: Call the optional __unload_plugin__ function of the
+        plugin module, remove commands and menu items, and remove the plugin
+        module and its submodules from sys.modules, so they can be garbage
+        collected.
+
+        Returns the released memory in bytes (difference of the memory
+        traced by tracemalloc), or None if tracemalloc is not tracing. The
+        resident set size is not used, the interpreter rarely returns freed
+        memory to the operating system.
+        '''
+        import gc
+        from .profiling import get_traced_memory
+
+        traced = get_traced_memory()
+
+        mod = self.module
+        if mod is not None and hasattr(mod, '__unload_plugin__'):
+            try:
+                mod.__unload_plugin__()
+            except:
+                if pref_get('verbose', False):
+                    import traceback
+                    traceback.print_exc()
+                print ' Warning: __unload_plugin__ failed for plugin "%s"' % (self.name)
+
+        self.unregister()
+        self.remove_stubs()
+
+        # including None entries (failed implicit relative imports)
+        prefix = self.mod_name + '.'
+        for name in list(sys.modules):
+            if name == self.mod_name or name.startswith(prefix):
+                del sys.modules[name]
+
+        # reference from parent package
+        parent_name, _, attr = self.mod_name.rpartition('.')
+        parent = sys.modules.get(parent_name)
+        if parent is not None and hasattr(parent, attr):
+            delattr(parent, attr)
+
+        del mod
+        self.importtime = None
+        self.inittime = None
+        self.loadtime = None
+        self.modules = []
+        self.mtimes = {}
+        self.stubs = []
+        self.initialized = False
+        self.memory = None
+
+        if traced is None:
+            return None
+
+        # only when measuring, a full collection per plugin is expensive
+        gc.collect()
+        return traced - get_traced_memory()
+
+    def get_module_names(self):
+        '''
+        Names of the loaded modules of this plugin (the plugin module and, in
+        case of a package, its submodules).
+        '''
+        prefix = self.mod_name + '.'
+        return [name for (name, mod) in sys.modules.items()
+                if mod is not None and (name == self.mod_name or
+                    name.startswith(prefix))]
+
+    def get_module_mtimes(self):
+        '''
+        Returns a dictionary {module name: mtime of source file} for the
+        loaded modules of this plugin.
+        '''
+        mtimes = {}
+        for name in self.get_module_names():
+            filename = getattr(sys.modules[name], '__file__', None)
+            if not filename:
+                continue
+            if filename[-4:] in ('.pyc', '.pyo'):
+                filename = filename[:-1]
+            try:
+                mtimes[name] = os.stat(filename).st_mtime
+            except OSError:
+                pass
+        return mtimes
+
+    def get_changed_modules(self):
+        '''
+        Names of loaded modules of this plugin whose source file changed
+        since loading.
+        '''
+        if not self.loaded:
+            return []
+        current = self.get_module_mtimes()
+        return sorted(name for (name, mtime) in current.iteritems()
+                if self.mtimes.get(name, mtime) != mtime)
+
+    def reload(self, pmgapp=None, force=0):
+        '''
+        Reload the changed modules of this plugin (all modules if force=1)
+        and the modules which depend on them, in dependency order. Commands
+        and menu items are unregistered first and the plugin gets
+        initialized again.
+
+        Returns False on failure.
+        '''
+        if not self.loaded:
+            return self.load(pmgapp)
+
+        if force:
+            changed = self.get_module_names()
+        else:
+            changed = self.get_changed_modules()
+            if not changed:
+                return True
+
+        order = get_reload_order(self.get_module_names(), changed)
+
+        if pmgapp is None:
+            pmgapp = get_pmgapp()
+
+        self.unregister()
+
+        push_loading_plugin(self)
+        try:
+            for name in order:
+                reload(sys.modules[name])
+            if self.initialized and pmgapp != -1:
+                self.legacyinit(pmgapp)
+        except:
+            self.load_failed()
+            return False
+        finally:
+            pop_loading_plugin()
+            self.mtimes = self.get_module_mtimes()
+
+        self.set_cached_commands()
+        if is_verbose():
+            print ' Plugin "%s" reloaded (%s)' % (self.name, ', '.join(order))
+
+        return True
 
     def uninstall(self, parent=None):
         '''
         Remove a plugin
 
-        Removes the complete directory tree in case of a package.
+        Removes the complete directory tree in case of a package, or the
+        archive file in case of a plugin which is imported from an archive.
         '''
         from .legacysupport import tkMessageBox
 
@@ -300,9 +1199,12 @@ class PluginInfo(object):
 
         showinfo = tkMessageBox.showinfo
         dirname, basename = os.path.split(self.filename)
+        archive = archives.split_archive_path(self.filename)[0]
 
         try:
-            if basename == '__init__.py':
+            if archive is not None:
+                os.remove(archive)
+            elif basename == '__init__.py':
                 import shutil
                 shutil.rmtree(dirname)
             else:
@@ -323,68 +1225,431 @@ class PluginInfo(object):
 
 def findPlugins(paths):
     '''
-    Find all python modules (extension .py and directories with __init__.py)
-    inside a list of directories.
+    Find all python modules (extension .py, directories with __init__.py
+    and zip archives which contain a package) inside a list of directories.
+
+    Directory listings are cached in the plugin index and only rescanned if
+    the directory mtime changed.
 
     Returns a dictionary with names to filenames mapping.
     '''
     import time
+    from .index import get_index
     start = time.time()
 
     verbose = pref_get('verbose', False)
+    index = get_index()
 
     modules = dict()
 
     for path in paths:
-        if not os.path.isdir(path):
-            continue
-
-        for filename in os.listdir(path):
-            # ignore names that start with dot or underscore
-            if filename[0] in ['.', '_']:
-                continue
-
-            if '.' in filename:
-                name, _, ext = filename.partition('.')
-                if ext == 'py':
-                    if name not in modules:
-                        modules[name] = os.path.join(path, filename)
-                    elif verbose:
-                        print ' warning: multiple plugins named', name
-            else:
-                name, filename = filename, os.path.join(path, filename, '__init__.py')
-                if os.path.exists(filename):
-                    if name not in modules:
-                        modules[name] = filename
-                    elif verbose:
-                        print ' warning: multiple plugins named', name
+        with tracing.span('scan ' + path, 'scan') as span:
+            dirmodules = index.get_dir(path)
+            span.args['cached'] = dirmodules is not None
+            metrics.counter('index_lookups_total', 'Plugin index lookups'
+                    ).inc(kind='directory', hit=str(dirmodules is not None))
+
+            if dirmodules is None:
+                if not os.path.isdir(path):
+                    continue
+                mtime = os.stat(path).st_mtime
+                dirmodules, pending = scanPluginDirectory(path)
+                index.set_dir(path, mtime, dirmodules, pending)
+
+        for name, filename in dirmodules:
+            if name not in modules:
+                modules[name] = filename
+            elif verbose:
+                print ' warning: multiple plugins named', name
+
+    index.prune(paths)
+    index.save()
+
+    metrics.counter('plugins_scanned_total', 'Plugins found by directory scans'
+            ).inc(len(modules))
 
     if verbose:
         print ' Scanning for modules took %.4f seconds' % (time.time() - start)
     return modules
 
-def loadPlugins(pmgapp=-1):
+def scanPluginDirectory(path):
+    '''
+    List a single plugin directory.
+
+    Returns a list of (name, filename) tuples and a list of
+    (pathname, mtime) tuples for subdirectories which don't contain a
+    __init__.py file (yet).
+    '''
+    modules = []
+    pending = []
+
+    for filename in sorted(os.listdir(path)):
+        # ignore names that start with dot or underscore
+        if filename[0] in ['.', '_']:
+            continue
+
+        if archives.is_archive(filename):
+            found = archives.scan_archive(os.path.join(path, filename))
+            if found is not None:
+                modules.append(found)
+        elif '.' in filename:
+            name, _, ext = filename.partition('.')
+            if ext == 'py':
+                modules.append((name, os.path.join(path, filename)))
+        else:
+            pathname = os.path.join(path, filename)
+            initfile = os.path.join(pathname, '__init__.py')
+            if os.path.exists(initfile):
+                modules.append((filename, initfile))
+            else:
+                try:
+                    pending.append((pathname, os.stat(pathname).st_mtime))
+                except OSError:
+                    pass
+
+    return modules, pending
+
+def loadPlugins(pmgapp=-1, lazy=None):
     '''
     Searches for plugins and registers them.
 
     Autoloads plugins, but does not do initialization if pmgapp is -1 (default).
 
+    In lazy mode (default: "lazy_autoload" preference), plugins which only
+    provide commands, and whose commands are known from a previous session,
+    are not imported but only get stub commands registered.
+
+    Plugins are loaded in dependency order, see loadPluginsByRequires.
+
     TODO: Call this on PyMOL launching, depending on a command line switch.
     '''
+    global plugins_registered
+    plugins_registered = True
+
+    if lazy is None:
+        lazy = pref_get('lazy_autoload', False)
+
     for parent in [startup]:
         modules = findPlugins(parent.__path__)
 
-        for name, filename in modules.iteritems():
+        infos = []
+        for name, filename in sorted(modules.iteritems()):
             mod_name = parent.__name__ + '.' + name
             info = PluginInfo(name, filename, mod_name)
             if info.autoload:
-                info.load(pmgapp)
+                if lazy and info.load_lazy():
+                    continue
+                infos.append(info)
+
+        loadPluginsByRequires(infos, pmgapp)
+
+def rescan(pmgapp=-1, load=True, quiet=1):
+    '''
+    Update the registered plugins from the current plugin search path.
+    Only directories whose mtime changed are listed again (see findPlugins).
+
+    New plugins are registered, and loaded if "load" is True and they are
+    autoload plugins. Plugins which moved to another file (e.g. with a
+    reordered search path) are updated, plugins which disappeared are
+    unregistered. Loaded plugins are kept as they are.
+
+    Returns a tuple of lists of names: (added, updated, removed)
+    '''
+    added, updated, removed = [], [], []
+
+    parent = startup
+    modules = findPlugins(parent.__path__)
+
+    for name, info in plugins.items():
+        if not info.loaded and name not in modules:
+            info.remove_stubs()
+            del plugins[name]
+            removed.append(name)
+
+    infos = []
+    for name, filename in sorted(modules.iteritems()):
+        info = plugins.get(name)
+        if info is not None:
+            if info.filename == filename or info.loaded:
+                continue
+            updated.append(name)
+            stubs = info.stubs
+            info.remove_stubs()
+            info = PluginInfo(name, filename, info.mod_name)
+            if stubs and not info.load_lazy():
+                infos.append(info)
+        else:
+            added.append(name)
+            info = PluginInfo(name, filename, parent.__name__ + '.' + name)
+            if info.autoload:
+                infos.append(info)
+
+    if load and infos:
+        loadPluginsByRequires(infos, pmgapp)
+
+    if not int(quiet):
+        for label, names in [('added', added), ('updated', updated), ('removed', removed)]:
+            if names:
+                print ' Plugins %s: %s' % (label, ', '.join(names))
+
+    return added, updated, removed
+
+def plugin_unload(name, quiet=None, *more):
+    '''
+DESCRIPTION
+
+    Unload plugins: remove their commands and menu items and their modules,
+    to release memory. A plugin may provide an __unload_plugin__ function to
+    clean up (e.g. release cached data) before it gets unloaded.
+
+    Released memory is reported if tracemalloc is tracing (see the
+    "profile_memory" preference).
+
+USAGE
+
+    plugin_unload name [, name ...]
+
+ARGUMENTS
+
+    name = string: plugin name, pattern, tag:name or profile:name, or a list
+    of those (see plugin_load)
+    '''
+    import gc
+
+    name, args = split_name_arguments(name, (quiet,) + more)
+    quiet = int((args + [None])[0] or 0)
+    names = resolve_plugin_names(name)
+    released_total = None
+
+    for name in names:
+        info = plugins[name]
+        if not info.loaded and not info.stubs:
+            if not int(quiet) and len(names) == 1:
+                print ' info: plugin not loaded'
+            continue
+        released = info.unload()
+        if released is not None:
+            released_total = (released_total or 0) + released
+        if not int(quiet):
+            if released is None:
+                print ' Plugin "%s" unloaded' % (name)
+            else:
+                print ' Plugin "%s" unloaded, released %.1f MB' % (name, released / 1024.**2)
+
+    # collect reference cycles of the unloaded modules once
+    gc.collect()
+
+    return released_total
+
+def plugin_rescan(quiet=0):
+    '''
+DESCRIPTION
+
+    Rescan the plugin search path for new, moved and removed plugins.
+    New plugins which are configured to load on startup get loaded.
+    '''
+    rescan(pmgapp=None, quiet=quiet)
+
+def get_reload_order(names, changed):
+    '''
+    Given a list of module names and a subset of changed module names,
+    return the changed modules plus all modules (from names) which depend on
+    them, sorted such that every module comes after its dependencies.
+
+    Module "a" depends on module "b" if the globals of "a" reference module
+    "b" or an object defined in "b".
+    '''
+    import types
+
+    names = set(names)
+    deps = {}
+    for name in names:
+        deps[name] = dset = set()
+        for value in vars(sys.modules[name]).values():
+            try:
+                if isinstance(value, types.ModuleType):
+                    other = value.__name__
+                else:
+                    other = getattr(value, '__module__', None)
+            except Exception:
+                continue
+            if other in names and other != name:
+                dset.add(other)
+
+    # transitive closure of dependents
+    affected = set(changed)
+    while True:
+        more = set(name for name in names
+                if name not in affected and deps[name] & affected)
+        if not more:
+            break
+        affected.update(more)
+
+    # topological sort
+    order = []
+    while affected:
+        ready = sorted(name for name in affected
+                if not (deps[name] & affected))
+        if not ready:
+            # cyclic dependency
+            ready = sorted(affected)
+        order.extend(ready)
+        affected.difference_update(ready)
+
+    return order
+
+def sortPluginsByRequires(infos, reloading=False):
+    '''
+    Sort plugins into groups by dependencies ("Requires" metadata field).
+    Plugins of one group only depend on plugins from previous groups.
+    Required plugins which are not in "infos" are added, unless already
+    loaded.
+
+    If reloading is True, only plugins in "infos" are sorted, by all their
+    dependencies within "infos", no matter if loaded or not (order for
+    reloading loaded plugins).
+
+    Returns a list of lists of PluginInfo instances.
+    '''
+    infos = list(infos)
+    requires = {}
+
+    i = 0
+    while i < len(infos):
+        info = infos[i]
+        requires[info.name] = names = []
+        for name in info.get_requires():
+            dep = plugins.get(name)
+            if dep is None:
+                print ' Warning: plugin "%s" requires unknown plugin "%s"' % \
+                        (info.name, name)
+            elif dep is info:
+                continue
+            elif reloading:
+                if dep in infos:
+                    names.append(name)
+            elif not dep.loaded:
+                names.append(name)
+                if dep not in infos:
+                    infos.append(dep)
+        i += 1
+
+    groups = []
+    done = set()
+    while infos:
+        group = [other for other in infos
+                if done.issuperset(requires[other.name])]
+        if not group:
+            print ' Warning: cyclic plugin dependencies:', \
+                    ', '.join(info.name for info in infos)
+            group = infos
+        groups.append(group)
+        done.update(info.name for info in group)
+        infos = [other for other in infos if other.name not in done]
+
+    return groups
+
+def loadPluginsByRequires(infos, pmgapp=-1):
+    '''
+    Load a list of plugins in dependency order (see sortPluginsByRequires).
+    All plugins of a group are imported first, then initialized
+    (legacyinit) before the next group, which may depend on them.
+
+    Returns a list of (PluginInfo, success) tuples.
+    '''
+    if pmgapp is None:
+        pmgapp = get_pmgapp()
+
+    results = []
+
+    for group in sortPluginsByRequires(infos):
+        imported = [info.load_import() for info in group]
+
+        for info, success in zip(group, imported):
+            if success:
+                success = info.load_init(pmgapp)
+            results.append((info, success))
+
+    return results
+
+# import plugins from archives
+archives.install_finder()
+
+# track commands of loading plugins
+if not hasattr(cmd.extend, 'tracked'):
+    _extend_orig = cmd.extend
+    _extend_tracked.tracked = True
+    cmd.extend = _extend_tracked
+
+# restore settings from last session
+pref_load()
+
+if pref_get('trace_file'):
+    tracing.trace_startup(cmd.exp_path(pref_get('trace_file')),
+            pref_get('trace_imports', False))
 
 # pymol commands
 cmd.extend('plugin_load', plugin_load)
 cmd.extend('plugin_pref_save', pref_save)
+cmd.extend('plugin_rescan', plugin_rescan)
+cmd.extend('plugin_unload', plugin_unload)
+
+from .profiling import plugin_profile, profile_sort_keys
+cmd.extend('plugin_profile', plugin_profile)
+
+from .profiling import plugin_memory, memory_sort_keys
+cmd.extend('plugin_memory', plugin_memory)
+
+from .tracing import plugin_trace
+cmd.extend('plugin_trace', plugin_trace)
+
+def plugin_metrics(filename='', format='', quiet=0):
+    '''
+DESCRIPTION
+
+    Print or save plugin engine metrics (counters and histograms for
+    scans, loads, cache hits, preference writes and network requests).
+
+USAGE
+
+    plugin_metrics [ filename [, format ]]
+
+ARGUMENTS
+
+    filename = string: output file {default: print to console}
+
+    format = prometheus|json {default: json if filename ends with .json,
+    otherwise prometheus}
+    '''
+    if not filename:
+        if not int(quiet):
+            print metrics.registry.prometheus_text()
+        return
+    filename = cmd.exp_path(filename)
+    if not format:
+        format = 'json' if filename.endswith('.json') else 'prometheus'
+    if format == 'json':
+        metrics.write_json(filename)
+    else:
+        metrics.write_prometheus(filename)
+
+cmd.extend('plugin_metrics', plugin_metrics)
+
+from .installation import plugin_install_manifest, install_policies
+cmd.extend('plugin_install_manifest', plugin_install_manifest)
+
+from .watch import plugin_watch, plugin_reload
+cmd.extend('plugin_watch', plugin_watch)
+cmd.extend('plugin_reload', plugin_reload)
 
 # autocompletion
-cmd.auto_arg[0]['plugin_load'] = [ lambda: cmd.Shortcut(plugins), 'plugin', ''  ]
+cmd.auto_arg[0]['plugin_load'] = [ lambda: plugins.completion, 'plugin', ''  ]
+cmd.auto_arg[0]['plugin_reload'] = [ lambda: plugins.completion, 'plugin', ''  ]
+cmd.auto_arg[0]['plugin_unload'] = [ lambda: plugins.completion, 'plugin', ''  ]
+cmd.auto_arg[0]['plugin_watch'] = [ lambda: cmd.Shortcut(['on', 'off']), 'state', ''  ]
+cmd.auto_arg[0]['plugin_trace'] = [ lambda: cmd.Shortcut(['start', 'stop']), 'action', ', '  ]
+cmd.auto_arg[0]['plugin_profile'] = [ lambda: cmd.Shortcut(profile_sort_keys), 'sort key', ', ' ]
+cmd.auto_arg[2]['plugin_install_manifest'] = [ lambda: cmd.Shortcut(install_policies), 'policy', ', ' ]
+cmd.auto_arg[0]['plugin_memory'] = [ lambda: cmd.Shortcut(memory_sort_keys), 'sort key', ', ' ]
 
 # vi:expandtab:smarttab:sw=4
@@ -0,0 +1,157 @@
+'''
+PyMOL Plugins Engine, Archive Plugins
+
+Plugins can be stored as zip archives (or wheels) in a plugin directory and
+are imported directly from the archive with zipimport, without extraction.
+
+The filename of such a plugin is a pseudo path through the archive, e.g.
+~/.pymol/startup/foo-1.0.zip/foo-1.0/foo/__init__.py, which is also what the
+imported module reports as __file__.
+
+License: BSD-2-Clause
+
+'''
+
+import os
+import re
+import sys
+
+# extensions of archives which are imported directly
+archive_extensions = ['zip', 'whl']
+
+_archive_path_re = re.compile(r'(.*?\.(?:%s))[/\\](.*)$' % '|'.join(archive_extensions),
+        re.IGNORECASE)
+
+def is_archive(filename):
+    return filename.rpartition('.')[2].lower() in archive_extensions
+
+def split_archive_path(filename):
+    '''
+    Split a pseudo path through an archive into archive filename and member
+    name (with forward slashes). Returns (None, filename) for normal files.
+    '''
+    m = _archive_path_re.match(filename)
+    if m is None:
+        return None, filename
+    return m.group(1), m.group(2).replace('\\', '/')
+
+def get_package_layout(namelist):
+    '''
+    Find the python package in the list of archive member names.
+
+    Supported layouts:
+    <name>/__init__.py
+    <name>-<version>/<name>/__init__.py
+
+    Returns a tuple of directory names, e.g. ('foo-1.0', 'foo'). Raises
+    ValueError if there is not exactly one package.
+    '''
+    namedict = dict()
+    for f in namelist:
+        x = namedict
+        for part in f.split('/'): # even on windows this is a forward slash (not os.sep)
+            if part != '':
+                x = x.setdefault(part, {})
+    if len(namedict) == 0:
+        raise ValueError('Archive empty.')
+
+    # case 1: zip/<name>/__init__.py
+    names = [(name,)
+            for name in namedict
+            if '__init__.py' in namedict[name]]
+    if len(names) == 0:
+        # case 2: zip/<name>-<version>/<name>/__init__.py
+        names = [(pname, name)
+                for (pname, pdict) in namedict.iteritems()
+                for name in pdict
+                if '__init__.py' in pdict[name]]
+
+    if len(names) == 0:
+        raise ValueError('Missing __init__.py')
+    if len(names) > 1:
+        raise ValueError('Archive must contain a single package.')
+
+    return names[0]
+
+def scan_archive(filename):
+    '''
+    Find the plugin in a zip archive. Returns (name, pseudo filename of
+    __init__.py), or None if the archive doesn't contain a plugin package.
+    '''
+    import zipfile
+    try:
+        zf = zipfile.ZipFile(filename)
+        try:
+            dirnames = get_package_layout(zf.namelist())
+        finally:
+            zf.close()
+    except (IOError, ValueError, zipfile.BadZipfile):
+        return None
+    return dirnames[-1], os.path.join(filename, *dirnames + ('__init__.py',))
+
+def open_file(filename):
+    '''
+    Open a plugin file for reading, which may be a member of an archive.
+    '''
+    archive, member = split_archive_path(filename)
+    if archive is None:
+        return open(filename)
+
+    import zipfile
+    from cStringIO import StringIO
+    zf = zipfile.ZipFile(archive)
+    try:
+        try:
+            content = zf.read(member)
+        except KeyError:
+            raise IOError('no such archive member: ' + filename)
+    finally:
+        zf.close()
+    return StringIO(content)
+
+def invalidate(archive):
+    '''
+    Forget cached zip directories and importers of an archive, which might
+    have been replaced (e.g. by reinstalling).
+    '''
+    import zipimport
+    zipimport._zip_directory_cache.pop(archive, None)
+    for path in sys.path_importer_cache.keys():
+        if path == archive or path.startswith(archive + os.sep):
+            del sys.path_importer_cache[path]
+
+class ArchiveFinder(object):
+    '''
+    Meta path finder (PEP 302) which imports registered plugins whose
+    filename points into an archive.
+    '''
+    def find_module(self, fullname, path=None):
+        from . import plugins
+
+        info = plugins.find_by_module(fullname)
+        if info is None or info.mod_name != fullname:
+            return None
+
+        archive, member = split_archive_path(info.filename)
+        if archive is None:
+            return None
+
+        import zipimport
+        invalidate(archive)
+
+        # directory inside the archive which contains the package
+        prefix = member.rsplit('/', 2)[0] if member.count('/') > 1 else ''
+        if prefix:
+            archive = os.path.join(archive, prefix.replace('/', os.sep))
+        try:
+            return zipimport.zipimporter(archive)
+        except zipimport.ZipImportError:
+            return None
+
+def install_finder():
+    for finder in sys.meta_path:
+        if isinstance(finder, ArchiveFinder):
+            return
+    sys.meta_path.append(ArchiveFinder())
+
+# vi:expandtab:smarttab:sw=4
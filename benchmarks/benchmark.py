@@ -0,0 +1,382 @@
+'''
+PyMOL Plugins Engine, Benchmarks
+
+Times the hot paths of the plugin engine on synthetic plugin directories,
+without a display and without PyMOL: "pymol" and "pmg_tk" are replaced by
+minimal stub modules.
+
+Usage:
+
+    python benchmarks/benchmark.py [--sizes 10,100,1000,10000] [-o results.json]
+
+Results are written as JSON, compare two runs with:
+
+    python benchmarks/benchmark.py --compare old.json new.json
+
+License: BSD-2-Clause
+
+'''
+
+import os
+import sys
+import time
+import types
+import shutil
+import tempfile
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# synthetic plugins
+
+HEADER_TEMPLATE = \
+'''# Author: Benchmark
+# License: BSD-2-Clause
+# Version: 1.%(i)d
+# Citation-Required: No
+'''
+
+BIG_HEADER_LINES = 200
+
+PLUGIN_TEMPLATE = \
+"""'''
+Synthetic plugin number %(i)d
+%(doc)s
+'''
+from pymol import cmd
+%(body)s
+def cmd_%(name)s():
+    return %(i)d
+cmd.extend('cmd_%(name)s', cmd_%(name)s)
+"""
+
+# plugin kinds, assigned round robin
+KINDS = ['module', 'package', 'bigheader', 'slowimport']
+
+def make_plugin(path, i):
+    '''
+    Write synthetic plugin number i into directory path. Returns plugin name.
+    '''
+    kind = KINDS[i % len(KINDS)]
+    name = 'bench_%s_%d' % (kind, i)
+    header = HEADER_TEMPLATE % {'i': i}
+    doc = ''
+    body = ''
+
+    if kind == 'bigheader':
+        header += ''.join('# Field%d: %s\n' % (j, 'x' * 60)
+                for j in range(BIG_HEADER_LINES))
+        doc = 'Long description line\n' * BIG_HEADER_LINES
+    elif kind == 'slowimport':
+        body = 'import time\ntime.sleep(0.001)\n'
+
+    source = header + PLUGIN_TEMPLATE % {'i': i, 'name': name,
+            'doc': doc, 'body': body}
+
+    if kind == 'package':
+        dirname = os.path.join(path, name)
+        os.mkdir(dirname)
+        filename = os.path.join(dirname, '__init__.py')
+        for j in range(3):
+            open(os.path.join(dirname, 'sub%d.py' % j), 'w').write('x = %d\n' % j)
+    else:
+        filename = os.path.join(path, name + '.py')
+
+    open(filename, 'w').write(source)
+    return name
+
+def make_tree(path, size):
+    '''
+    Create a startup directory with "size" synthetic plugins.
+    '''
+    os.makedirs(path)
+    names = [make_plugin(path, i) for i in range(size)]
+
+    # set mtime to the past, so that the plugin index caches the entries
+    past = time.time() - 3600
+    for root, dirnames, filenames in os.walk(path):
+        for basename in dirnames + filenames:
+            os.utime(os.path.join(root, basename), (past, past))
+    os.utime(path, (past, past))
+
+    return names
+
+def make_archive(path, nfiles):
+    '''
+    Create a zip archive with a package plugin with "nfiles" submodules.
+    '''
+    import zipfile
+    filename = os.path.join(path, 'bench_archive-1.0.zip')
+    zf = zipfile.ZipFile(filename, 'w', zipfile.ZIP_DEFLATED)
+    zf.writestr('bench_archive-1.0/bench_archive/__init__.py',
+            HEADER_TEMPLATE % {'i': 0} + "'''archive plugin'''\n")
+    for j in range(nfiles):
+        zf.writestr('bench_archive-1.0/bench_archive/sub%d.py' % j,
+                'x = %d\n' % j * 20)
+    zf.close()
+    return filename
+
+# stub environment
+
+def install_stubs(startup_path):
+    '''
+    Put minimal "pymol" and "pmg_tk" modules into sys.modules and import the
+    plugin engine as "pymolplugins".
+    '''
+    import imp
+
+    class Storage(object):
+        pass
+
+    class MenuBar(object):
+        def addmenuitem(self, *args, **kwargs):
+            pass
+        addcascademenu = deletemenuitems = addmenuitem
+
+    class Shortcut(object):
+        def __init__(self, keywords):
+            self.keywords = list(keywords)
+        def append(self, keyword):
+            self.keywords.append(keyword)
+
+    cmd = types.ModuleType('pymol.cmd')
+    cmd.keyword = {}
+    cmd.auto_arg = [{}, {}, {}]
+    cmd.kwhash = Shortcut([])
+    cmd.Shortcut = Shortcut
+    def extend(name, function):
+        cmd.keyword[name] = [function, 0, 0, ',', 0]
+    cmd.extend = extend
+    cmd.exp_path = lambda p: os.path.expanduser(os.path.expandvars(p))
+    cmd.get = lambda name, *args: tempfile.gettempdir()
+
+    pymol = types.ModuleType('pymol')
+    pymol.cmd = cmd
+    pymol.Scratch_Storage = Storage
+    pymol.invocation = Storage()
+    pymol.invocation.options = Storage()
+    pymol.invocation.options.show_splash = 0
+    pymol._ext_gui = Storage()
+    pymol._ext_gui.root = None
+    pymol._ext_gui.menuBar = MenuBar()
+
+    pmg_tk = types.ModuleType('pmg_tk')
+    pmg_tk.__path__ = []
+    pmg_tk.PMGApp = type('PMGApp', (object,), {})
+    startup = types.ModuleType('pmg_tk.startup')
+    startup.__path__ = [startup_path]
+    pmg_tk.startup = startup
+
+    sys.modules.update({
+        'pymol': pymol,
+        'pymol.cmd': cmd,
+        'pmg_tk': pmg_tk,
+        'pmg_tk.startup': startup,
+    })
+
+    pymolplugins = imp.load_module('pymolplugins', None, PACKAGE_DIR,
+            ('', '', imp.PKG_DIRECTORY))
+    pymolplugins.preferences['verbose'] = False
+
+    # non-interactive dialogs
+    class MessageBox(object):
+        def __getattr__(self, name):
+            if name.startswith('ask'):
+                return lambda *args, **kwargs: True
+            return lambda *args, **kwargs: None
+    from pymolplugins import legacysupport
+    legacysupport.tkMessageBox = MessageBox()
+    legacysupport.get_tk_focused = lambda: None
+
+    return pymolplugins
+
+# benchmarks
+
+class Benchmark(object):
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def time(self, name, size, func, setup=None, repeat=None):
+        '''
+        Run func (after setup) "repeat" times, record the best time.
+        '''
+        times = []
+        for _ in range(repeat or self.repeat):
+            if setup is not None:
+                setup()
+            start = time.time()
+            func()
+            times.append(time.time() - start)
+
+        result = {
+            'name': name,
+            'size': size,
+            'best': min(times),
+            'mean': sum(times) / len(times),
+            'repeat': len(times),
+        }
+        self.results.append(result)
+        print ' %-28s %7d %10.4f s' % (name, size, result['best'])
+        return result
+
+def run_size(bench, p, tmpdir, size):
+    from pymolplugins import index
+
+    path = os.path.join(tmpdir, 'startup%d' % size)
+    make_tree(path, size)
+    p.set_startup_path([path], False)
+    paths = [path]
+
+    def cold_index():
+        index._index = index.PluginIndex(index.get_index_filename())
+
+    # directory scan
+    bench.time('findPlugins cold', size, lambda: p.findPlugins(paths), cold_index)
+    bench.time('findPlugins warm', size, lambda: p.findPlugins(paths))
+
+    modules = p.findPlugins(paths)
+
+    # metadata and docstrings, fresh PluginInfo instances each round
+    infos = []
+    def new_infos():
+        infos[:] = [p.PluginInfo(name, filename, 'pmg_tk.startup.' + name)
+                for (name, filename) in modules.iteritems()]
+    def cold():
+        cold_index()
+        new_infos()
+    def get_metadata():
+        for info in infos:
+            info.get_metadata()
+    def get_docstring():
+        for info in infos:
+            info.get_docstring()
+    bench.time('get_metadata cold', size, get_metadata, cold)
+    index.get_index().save()
+    bench.time('get_metadata warm', size, get_metadata, new_infos)
+    bench.time('get_docstring cold', size, get_docstring, cold)
+    index.get_index().save()
+    bench.time('get_docstring warm', size, get_docstring, new_infos)
+
+    # plugin name completion (prefix, substring and fuzzy)
+    def complete():
+        sc = p.cmd.auto_arg[0]['plugin_load'][0]()
+        for query in ['bench_m', 'package_1', 'bslow9']:
+            sc.interpret(query)
+    bench.time('completion', size, complete)
+
+    # loading, unload between rounds
+    def unload_all():
+        for info in p.plugins.values():
+            if info.loaded:
+                info.unload()
+        p.plugins.clear()
+    bench.time('loadPlugins', size, p.loadPlugins, unload_all)
+    unload_all()
+
+    # preferences
+    def fill_prefs():
+        for name in modules:
+            p.autoload[name] = True
+            p.preferences[name + '.setting'] = 'x' * 20
+    bench.time('pref_save', size, p.pref_save, fill_prefs)
+    for name in modules:
+        p.preferences.pop(name + '.setting', None)
+    p.autoload.clear()
+
+def run_install(bench, p, tmpdir, nfiles):
+    from pymolplugins import installation
+
+    plugdir = os.path.join(tmpdir, 'install%d' % nfiles)
+    os.makedirs(plugdir)
+    p.set_startup_path([plugdir], False)
+
+    archive = make_archive(tmpdir, nfiles)
+    tempdirs = []
+
+    def extract():
+        tempdirs.append(installation.extract_zipfile(archive, 'zip')[0])
+    bench.time('extract_zipfile', nfiles, extract)
+    for tempdir in tempdirs:
+        shutil.rmtree(tempdir)
+
+    def uninstall():
+        info = p.plugins.pop('bench_archive', None)
+        if info is not None and info.loaded:
+            info.unload()
+        target = os.path.join(plugdir, 'bench_archive')
+        if os.path.exists(target):
+            shutil.rmtree(target)
+    bench.time('installPluginFromFile', nfiles,
+            lambda: installation.installPluginFromFile(archive), uninstall)
+
+def compare(filename_old, filename_new):
+    '''
+    Print relative change of best times between two result files.
+    '''
+    import json
+    old = json.load(open(filename_old))['results']
+    new = json.load(open(filename_new))['results']
+    old = dict(((r['name'], r['size']), r['best']) for r in old)
+    for r in new:
+        key = (r['name'], r['size'])
+        if key not in old:
+            continue
+        ratio = r['best'] / old[key] if old[key] else float('inf')
+        print ' %-28s %7d %10.4f s -> %10.4f s  (%.2fx)' % (key + (old[key],
+            r['best'], ratio))
+
+def main():
+    import json
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Plugin engine benchmarks')
+    parser.add_argument('--sizes', default='10,100,1000,10000',
+            help='comma separated plugin tree sizes')
+    parser.add_argument('--archive-files', default='10,1000',
+            help='comma separated number of files in archive benchmarks')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('-o', '--output', help='write JSON results to file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+            help='compare two JSON result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    tmpdir = tempfile.mkdtemp(prefix='pymolplugins-bench-')
+
+    # registered first, runs last (after the engine's own atexit handlers)
+    import atexit
+    atexit.register(shutil.rmtree, tmpdir, True)
+
+    # keep preferences and index of the benchmark away from the user's
+    os.environ['HOME'] = tmpdir
+    os.environ.pop('APPDATA', None)
+
+    p = install_stubs(os.path.join(tmpdir, 'startup'))
+
+    bench = Benchmark(args.repeat)
+    print ' %-28s %7s %12s' % ('benchmark', 'size', 'best')
+
+    for size in [int(s) for s in args.sizes.split(',')]:
+        run_size(bench, p, tmpdir, size)
+    for nfiles in [int(s) for s in args.archive_files.split(',')]:
+        run_install(bench, p, tmpdir, nfiles)
+
+    if args.output:
+        import platform
+        data = {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'time': time.time(),
+            'results': bench.results,
+        }
+        f = open(args.output, 'w')
+        json.dump(data, f, indent=1)
+        f.close()
+
+if __name__ == '__main__':
+    main()
+
+# vi:expandtab:smarttab:sw=4
@@ -0,0 +1,112 @@
+'''
+PyMOL Plugins Engine, Completion
+
+Persistent completion index for plugin names, a drop-in replacement for
+cmd.Shortcut in cmd.auto_arg entries which is updated incrementally instead
+of being rebuilt on every completion request.
+
+Matching falls back from prefix to substring to fuzzy (subsequence) matches.
+With multi=True, the last name of a space or "+" separated list is completed.
+
+License: BSD-2-Clause
+
+'''
+
+import bisect
+import re
+
+class CompletionIndex(object):
+    '''
+    Sorted list of keywords with cmd.Shortcut compatible interpret() method.
+    '''
+    def __init__(self, keywords=(), multi=False):
+        self.keywords = sorted(set(keywords))
+        self.multi = multi
+
+    def __contains__(self, keyword):
+        i = bisect.bisect_left(self.keywords, keyword)
+        return i < len(self.keywords) and self.keywords[i] == keyword
+
+    has_key = __contains__
+
+    def append(self, keyword):
+        i = bisect.bisect_left(self.keywords, keyword)
+        if i == len(self.keywords) or self.keywords[i] != keyword:
+            self.keywords.insert(i, keyword)
+
+    def remove(self, keyword):
+        i = bisect.bisect_left(self.keywords, keyword)
+        if i < len(self.keywords) and self.keywords[i] == keyword:
+            del self.keywords[i]
+
+    def rebuild(self, keywords):
+        self.keywords = sorted(set(keywords))
+
+    def get_prefix_matches(self, prefix):
+        i = bisect.bisect_left(self.keywords, prefix)
+        matches = []
+        for keyword in self.keywords[i:]:
+            if not keyword.startswith(prefix):
+                break
+            matches.append(keyword)
+        return matches
+
+    def get_matches(self, keyword):
+        '''
+        Returns the list of keywords which match "keyword": all keywords with
+        this prefix, or if there are none, all keywords which contain it
+        (case insensitive), or if there are none, all keywords which contain
+        its characters in order.
+        '''
+        matches = self.get_prefix_matches(keyword)
+        if matches or not keyword:
+            return matches
+
+        lower = keyword.lower()
+        matches = [k for k in self.keywords if lower in k.lower()]
+        if matches:
+            return matches
+
+        pattern = re.compile('.*?'.join(re.escape(c) for c in lower))
+        return [k for k in self.keywords if pattern.search(k.lower())]
+
+    def interpret(self, keyword, mode=0):
+        '''
+        cmd.Shortcut compatible: Returns the keyword if it's complete or the
+        only match, a list of matches if ambiguous, or None.
+        '''
+        head = ''
+        if self.multi:
+            m = re.match(r'(.*[\s+])(.*)$', keyword)
+            if m is not None:
+                head, keyword = m.groups()
+
+        if keyword in self:
+            return head + keyword
+
+        matches = self.get_matches(keyword)
+        if not matches:
+            return None
+        if len(matches) == 1:
+            return head + matches[0]
+        return [head + k for k in matches]
+
+    def auto_err(self, keyword, descrip=None):
+        '''
+        cmd.Shortcut compatible: Raise an error if keyword is not a unique
+        match, otherwise return the full keyword.
+        '''
+        from pymol import cmd
+
+        result = self.interpret(keyword)
+        if result is None:
+            if descrip is not None:
+                print ' Error: unknown %s "%s"' % (descrip, keyword)
+            raise cmd.QuietException
+        if not isinstance(result, basestring):
+            if descrip is not None:
+                print ' Error: ambiguous %s "%s"' % (descrip, keyword)
+            raise cmd.QuietException
+        return result
+
+# vi:expandtab:smarttab:sw=4
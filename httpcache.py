@@ -0,0 +1,281 @@
+'''
+PyMOL Plugins Engine, HTTP Cache
+
+Persistent on-disk cache for repository listings and downloads
+(~/.pymol/plugin_cache/http). Entries store the response body together with
+its validators (ETag, Last-Modified). Entries younger than the
+"http_cache_max_age" preference are served without a request, older entries
+are revalidated with a conditional request. If the network is unreachable,
+stale entries are served. The least recently used entries are evicted when
+the total size exceeds "http_cache_size".
+
+Preferences:
+
+    http_cache          enable the cache {default: True}
+    http_cache_max_age  seconds until revalidation {default: 300}
+    http_cache_size     maximum total size in bytes {default: 50 MB}
+
+License: BSD-2-Clause
+
+'''
+
+import os
+import time
+import threading
+
+from .pluginfile import TMP_INFIX
+
+# increment if the layout of cache files changes
+CACHE_VERSION = 1
+
+DEFAULT_MAX_AGE = 300
+DEFAULT_SIZE = 50 * 1024 * 1024
+
+_lock = threading.Lock()
+
+def get_cache_dir():
+    '''
+    Cache lives next to the default user plugin directory
+    (~/.pymol/plugin_cache/http)
+    '''
+    from .installation import get_default_user_plugin_path
+    return os.path.join(os.path.dirname(get_default_user_plugin_path()),
+            'plugin_cache', 'http')
+
+def is_enabled():
+    from . import pref_get
+    return bool(pref_get('http_cache', True))
+
+def get_entry_filename(url):
+    import hashlib
+    return os.path.join(get_cache_dir(), hashlib.sha1(url).hexdigest())
+
+class CacheEntry(object):
+    '''
+    Cached response. A cache file has a JSON header line followed by the
+    response body.
+    '''
+    __slots__ = ['url', 'filename', 'etag', 'last_modified', 'stored', 'content']
+
+    def __init__(self, url, filename, etag=None, last_modified=None,
+            stored=0.0, content=''):
+        self.url = url
+        self.filename = filename
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored
+        self.content = content
+
+    def get_age(self):
+        return time.time() - self.stored
+
+    def is_fresh(self, max_age):
+        return 0 <= self.get_age() < max_age
+
+    def get_conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def touch(self):
+        '''
+        Mark entry as used (the file mtime is the LRU timestamp).
+        '''
+        try:
+            os.utime(self.filename, None)
+        except OSError:
+            pass
+
+    def save(self):
+        import json
+        from . import write_file_atomic
+
+        header = json.dumps({
+            'version': CACHE_VERSION,
+            'url': self.url,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'stored': self.stored,
+        }, sort_keys=True)
+
+        dirname = os.path.dirname(self.filename)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        write_file_atomic(self.filename, header + '\n' + self.content, 'wb')
+
+def lookup(url):
+    '''
+    Returns the CacheEntry for url, or None.
+    '''
+    import json
+    from . import _str_recursive
+
+    filename = get_entry_filename(url)
+    try:
+        f = open(filename, 'rb')
+        try:
+            header = _str_recursive(json.loads(f.readline()))
+            content = f.read()
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return None
+
+    if header.get('version') != CACHE_VERSION or header.get('url') != url:
+        return None
+
+    return CacheEntry(url, filename, header.get('etag'),
+            header.get('last_modified'), header.get('stored', 0.0), content)
+
+def lookup_fresh(url):
+    '''
+    Returns the CacheEntry for url if it's younger than the
+    "http_cache_max_age" preference, or None.
+    '''
+    from . import pref_get
+    from . import metrics
+
+    entry = lookup(url)
+    if entry is None or not entry.is_fresh(pref_get('http_cache_max_age',
+            DEFAULT_MAX_AGE)):
+        return None
+
+    entry.touch()
+    metrics.counter('http_cache_total', 'HTTP cache lookups').inc(result='hit')
+    return entry
+
+def store(url, response, content=None):
+    '''
+    Store a response (see repository.Response) unless the server asked
+    not to ("Cache-Control: no-store"). The response body is stored, or
+    "content" if given (e.g. data derived from a partial response, stored
+    with the validators of the response). Returns the CacheEntry or None.
+    '''
+    headers = response.info()
+    if 'no-store' in (headers.getheader('cache-control') or '').lower():
+        return None
+
+    if content is None:
+        content = response.content
+
+    entry = CacheEntry(url, get_entry_filename(url),
+            headers.getheader('etag'), headers.getheader('last-modified'),
+            time.time(), content)
+    try:
+        entry.save()
+    except (IOError, OSError):
+        return None
+
+    evict()
+    return entry
+
+def refresh(entry):
+    '''
+    Entry was revalidated (304 Not Modified), restart its max-age.
+    '''
+    entry.stored = time.time()
+    try:
+        entry.save()
+    except (IOError, OSError):
+        pass
+
+def evict(maxsize=None):
+    '''
+    Remove least recently used entries until the total size is below
+    maxsize (default: "http_cache_size" preference).
+    '''
+    from . import pref_get
+
+    if maxsize is None:
+        maxsize = pref_get('http_cache_size', DEFAULT_SIZE)
+
+    dirname = get_cache_dir()
+    with _lock:
+        entries = []
+        total = 0
+        try:
+            names = os.listdir(dirname)
+        except OSError:
+            return
+        for name in names:
+            # in-progress writes of write_file_atomic
+            if TMP_INFIX in name:
+                continue
+            filename = os.path.join(dirname, name)
+            try:
+                s = os.stat(filename)
+            except OSError:
+                continue
+            entries.append((s.st_mtime, s.st_size, filename))
+            total += s.st_size
+
+        entries.sort()
+        for (mtime, size, filename) in entries:
+            if total <= maxsize:
+                break
+            try:
+                os.remove(filename)
+            except OSError:
+                continue
+            total -= size
+
+def clear():
+    '''
+    Remove all cache entries.
+    '''
+    evict(0)
+
+def cached_request(url, request):
+    '''
+    Fetch url through the cache. "request(url, headers)" must perform the
+    actual request and return a Response (with code 200 or 304), or raise
+    IOError.
+
+    Returns a (content, result) tuple, where result is one of "hit",
+    "revalidated", "miss", "stale" or "uncached".
+    '''
+    from . import pref_get
+    from . import metrics
+
+    entry = lookup(url)
+    if entry is not None and entry.is_fresh(pref_get('http_cache_max_age',
+            DEFAULT_MAX_AGE)):
+        result = 'hit'
+    else:
+        headers = entry.get_conditional_headers() if entry is not None else {}
+        try:
+            response = request(url, headers)
+        except IOError as e:
+            # serve stale entry if the server can't be reached (HTTP errors
+            # like 404 are not hidden)
+            if entry is None or getattr(e, 'code', None) is not None:
+                raise
+            print ' Plugin-Warning: %s unreachable, using cached copy' % (url)
+            result = 'stale'
+        else:
+            if response.code == 304 and entry is not None:
+                refresh(entry)
+                result = 'revalidated'
+            elif response.code == 200:
+                if store(url, response) is None:
+                    result = 'uncached'
+                else:
+                    result = 'miss'
+                entry = None
+                content = response.content
+            else:
+                entry = None
+                content = response.content
+                result = 'uncached'
+
+    if entry is not None:
+        entry.touch()
+        content = entry.content
+
+    metrics.counter('http_cache_total', 'HTTP cache lookups').inc(result=result)
+    return content, result
+
+# vi:expandtab:smarttab:sw=4
@@ -0,0 +1,211 @@
+'''
+PyMOL Plugins Engine, Plugin Index Cache
+
+Persistent on-disk cache for the plugin directory scan and for parsed plugin
+files (metadata, docstring). Directory entries are validated by the directory
+mtime, file entries by mtime, size and inode. Warm launches only have to stat
+directories and files, unchanged entries are not read again.
+
+License: BSD-2-Clause
+
+'''
+
+import os
+import time
+
+# increment if the layout of the pickled data changes
+INDEX_VERSION = 1
+
+# entries which have been modified less than this number of seconds before
+# scanning are not cached, since a following modification might not change
+# the (low resolution) mtime
+RACY_SECONDS = 2.0
+
+def get_index_filename():
+    '''
+    Index file lives next to the default user plugin directory
+    (~/.pymol/plugin_index.pkl)
+    '''
+    from .installation import get_default_user_plugin_path
+    return os.path.join(os.path.dirname(get_default_user_plugin_path()),
+            'plugin_index.pkl')
+
+def stat_key(filename):
+    '''
+    Return (mtime, size, inode) tuple of file, or None if it does not exist.
+    For archive members, this is the archive file's stat key.
+    '''
+    from .archives import split_archive_path
+    archive = split_archive_path(filename)[0]
+    try:
+        s = os.stat(archive or filename)
+    except OSError:
+        return None
+    return (s.st_mtime, s.st_size, s.st_ino)
+
+def is_racy(mtime):
+    return mtime > time.time() - RACY_SECONDS
+
+class PluginIndex(object):
+    '''
+    Cache for the plugin directory scan and for per-file information.
+
+    dirs:  path -> (mtime, modules, pending)
+           modules: list of (name, filename) tuples
+           pending: list of (pathname, mtime) tuples for subdirectories
+                    without __init__.py, a package might appear there
+    files: filename -> (stat_key, record)
+           record: dict with keys like "metadata" and "docstring"
+    '''
+    def __init__(self, filename=None):
+        self.filename = filename
+        self.dirs = {}
+        self.files = {}
+        self.changed = False
+
+    def load(self):
+        import cPickle
+
+        if self.filename is None:
+            return
+
+        try:
+            f = open(self.filename, 'rb')
+            try:
+                data = cPickle.load(f)
+            finally:
+                f.close()
+        except IOError:
+            return
+        except Exception:
+            # corrupt index file, will be rewritten on next save
+            self.changed = True
+            return
+
+        if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+            self.changed = True
+            return
+
+        self.dirs = data['dirs']
+        self.files = data['files']
+
+    def save(self):
+        '''
+        Write index to disk (only if changed).
+        '''
+        import cPickle
+        from . import write_file_atomic
+
+        if not self.changed or self.filename is None:
+            return
+
+        data = {
+            'version': INDEX_VERSION,
+            'dirs': self.dirs,
+            'files': self.files,
+        }
+
+        try:
+            dirname = os.path.dirname(self.filename)
+            if not os.path.exists(dirname):
+                os.makedirs(dirname)
+            write_file_atomic(self.filename,
+                    cPickle.dumps(data, cPickle.HIGHEST_PROTOCOL), 'wb')
+        except (IOError, OSError):
+            print ' Plugin-Warning: Cannot write plugin index to', self.filename
+            return
+
+        self.changed = False
+
+    def get_dir(self, path):
+        '''
+        Return cached list of (name, filename) tuples for directory, or None
+        if the directory (or a pending subdirectory) changed since caching.
+        '''
+        entry = self.dirs.get(path)
+        if entry is None:
+            return None
+
+        mtime, modules, pending = entry
+
+        try:
+            if os.stat(path).st_mtime != mtime:
+                return None
+            for (pathname, submtime) in pending:
+                if os.stat(pathname).st_mtime != submtime:
+                    return None
+        except OSError:
+            return None
+
+        return modules
+
+    def set_dir(self, path, mtime, modules, pending):
+        if is_racy(mtime):
+            self.dirs.pop(path, None)
+        else:
+            self.dirs[path] = (mtime, modules, pending)
+        self.changed = True
+
+    def get_record(self, filename):
+        '''
+        Return the (mutable) record dict for file. The record is empty if the
+        file changed since caching. Call set_changed() after modification.
+        '''
+        key = stat_key(filename)
+        entry = self.files.get(filename)
+        if entry is not None and entry[0] == key:
+            return entry[1]
+
+        record = {}
+        if key is not None and not is_racy(key[0]):
+            self.files[filename] = (key, record)
+        else:
+            self.files.pop(filename, None)
+        self.changed = True
+        return record
+
+    def set_changed(self):
+        self.changed = True
+
+    def prune(self, paths):
+        '''
+        Remove directory entries not in paths, and file entries not found
+        in any of the (valid) directory entries.
+        '''
+        paths = set(paths)
+        for path in self.dirs.keys():
+            if path not in paths:
+                del self.dirs[path]
+                self.changed = True
+
+        filenames = set(filename
+                for (_, modules, _) in self.dirs.itervalues()
+                for (_, filename) in modules)
+        for filename in self.files.keys():
+            if filename not in filenames:
+                del self.files[filename]
+                self.changed = True
+
+_index = None
+
+def get_index():
+    '''
+    Returns the PluginIndex singleton. If the "index_cache" preference is
+    False, returns a non-persistent instance.
+    '''
+    global _index
+
+    if _index is None:
+        from . import pref_get
+        if pref_get('index_cache', True):
+            _index = PluginIndex(get_index_filename())
+            _index.load()
+
+            import atexit
+            atexit.register(_index.save)
+        else:
+            _index = PluginIndex()
+
+    return _index
+
+# vi:expandtab:smarttab:sw=4
@@ -87,57 +87,388 @@ def check_valid_name(name):
     if '.' in name:
         raise BadInstallationFile('name must not contain dots (%s).' % repr(name))
 
-def extract_zipfile(ofile, ext):
+def check_member_path(name):
     '''
-    Extract zip file to temporary directory
+    Validate archive member name, returns the list of path components.
+    Raises BadInstallationFile for absolute paths and ".." components.
+    '''
+    parts = [part for part in name.replace('\\', '/').split('/')
+            if part not in ('', '.')]
+    if name[:1] in ('/', '\\') or '..' in parts or (parts and ':' in parts[0]):
+        raise BadInstallationFile('Archive contains unsafe path name (%s).' % repr(name))
+    return parts
+
+def extract_archive(ofile, ext, destdir):
     '''
+    Extract archive into directory destdir in a single pass over the
+    members (tar files are read as a stream). Member paths are validated
+    before anything is written, only regular files and directories are
+    extracted.
+
+    Returns the package layout, see archives.get_package_layout
+    '''
+    import time
+    import shutil
+    from .archives import get_package_layout
+
+    def makedirs(dirname):
+        if not os.path.isdir(dirname):
+            os.makedirs(dirname)
+
+    def write(parts, fsrc, mtime, mode=None):
+        target = os.path.join(destdir, *parts)
+        makedirs(os.path.dirname(target))
+        fdst = open(target, 'wb')
+        try:
+            shutil.copyfileobj(fsrc, fdst)
+        finally:
+            fdst.close()
+            fsrc.close()
+        if mode:
+            os.chmod(target, mode & 0777 | 0600)
+        # keep archive timestamps (see sync_directory)
+        os.utime(target, (mtime, mtime))
+
+    namelist = []
+
     if ext == 'zip':
         import zipfile
         zf = zipfile.ZipFile(ofile)
+        try:
+            for member in zf.infolist():
+                parts = check_member_path(member.filename)
+                if not parts:
+                    continue
+                namelist.append('/'.join(parts))
+                if member.filename.endswith('/'):
+                    makedirs(os.path.join(destdir, *parts))
+                else:
+                    write(parts, zf.open(member),
+                            time.mktime(member.date_time + (0, 0, -1)))
+        finally:
+            zf.close()
     else:
         import tarfile
-        zf = tarfile.open(ofile)
-        zf.namelist = zf.getnames
-    # make sure pathnames are not absolute
-    cwd = os.getcwd()
-    namelist = zf.namelist()
-    for f in namelist:
-        f = os.path.normpath(f)
-        if not os.path.abspath(f).startswith(cwd):
-            raise BadInstallationFile('ZIP file contains absolute path names')
-    # analyse structure
-    namedict = dict()
-    for f in namelist:
-        x = namedict
-        for part in f.split('/'): # even on windows this is a forward slash (not os.sep)
-            if part != '':
-                x = x.setdefault(part, {})
-    if len(namedict) == 0:
-        raise BadInstallationFile('Archive empty.')
-
-    # case 1: zip/<name>/__init__.py
-    names = [(name,)
-            for name in namedict
-            if '__init__.py' in namedict[name]]
-    if len(names) == 0:
-        # case 2: zip/<name>-<version>/<name>/__init__.py
-        names = [(pname, name)
-                for (pname, pdict) in namedict.iteritems()
-                for name in pdict
-                if '__init__.py' in pdict[name]]
-
-    if len(names) == 0:
-        raise BadInstallationFile('Missing __init__.py')
-    if len(names) > 1:
-        raise BadInstallationFile('Archive must contain a single package.')
-    check_valid_name(names[0][-1])
-
-    # extract
+        tf = tarfile.open(ofile, 'r|*')
+        try:
+            for member in tf:
+                parts = check_member_path(member.name)
+                if not parts:
+                    continue
+                if member.isdir():
+                    makedirs(os.path.join(destdir, *parts))
+                elif member.isfile():
+                    write(parts, tf.extractfile(member), member.mtime,
+                            member.mode)
+                else:
+                    raise BadInstallationFile('Archive contains links or '
+                            'special files (%s).' % repr(member.name))
+                namelist.append('/'.join(parts))
+        finally:
+            tf.close()
+
+    try:
+        dirnames = get_package_layout(namelist)
+    except ValueError as e:
+        raise BadInstallationFile(str(e))
+    check_valid_name(dirnames[-1])
+
+    return dirnames
+
+def extract_zipfile(ofile, ext):
+    '''
+    Extract zip file to temporary directory
+    '''
+    import shutil
     import tempfile
     tempdir = tempfile.mkdtemp()
-    zf.extractall(tempdir)
+    try:
+        dirnames = extract_archive(ofile, ext, tempdir)
+    except:
+        shutil.rmtree(tempdir)
+        raise
+    return tempdir, dirnames
 
-    return tempdir, names[0]
+def swap_directory(src, target):
+    '''
+    Move directory src to target (on the same file system). An existing
+    target directory stays complete until the new one is in place: it is
+    renamed aside, src is renamed to target, then the old one is removed.
+    '''
+    import shutil
+    old = None
+    if os.path.exists(target):
+        old = '%s.old%d' % (target, os.getpid())
+        os.rename(target, old)
+    try:
+        os.rename(src, target)
+    except OSError:
+        if old is not None:
+            os.rename(old, target)
+        raise
+    if old is not None:
+        shutil.rmtree(old, True)
+
+def file_digest(filename):
+    import hashlib
+    h = hashlib.sha1()
+    f = open(filename, 'rb')
+    try:
+        for chunk in iter(lambda: f.read(1 << 16), ''):
+            h.update(chunk)
+    finally:
+        f.close()
+    return h.digest()
+
+def sync_directory(src, target):
+    '''
+    Update directory target to match directory src, writing only files
+    which changed: Files with equal size are compared by content hash
+    (mtimes are not reliable for extracted archives, zip timestamps have a
+    2 second resolution and build tools often write fixed dates). Changed
+    files are replaced atomically (written to a temporary file and
+    renamed). Files which are not in src are removed.
+
+    Unchanged source files keep their mtime, so their compiled bytecode
+    (.pyc/.pyo) stays valid and is kept, bytecode of removed sources is
+    removed.
+
+    Returns a dictionary with counts of "copied", "unchanged" and "removed"
+    files.
+    '''
+    import shutil
+    import tempfile
+    from . import metrics
+    from .pluginfile import TMP_INFIX
+
+    counts = {'copied': 0, 'unchanged': 0, 'removed': 0}
+    srcfiles = set()
+
+    for root, dirnames, filenames in os.walk(src):
+        relroot = os.path.relpath(root, src)
+        targetroot = os.path.normpath(os.path.join(target, relroot))
+        if not os.path.isdir(targetroot):
+            if os.path.exists(targetroot):
+                os.remove(targetroot)
+            os.makedirs(targetroot)
+
+        for filename in filenames:
+            srcfile = os.path.join(root, filename)
+            targetfile = os.path.join(targetroot, filename)
+            srcfiles.add(os.path.normpath(os.path.join(relroot, filename)))
+
+            s_src = os.stat(srcfile)
+            try:
+                s_target = os.stat(targetfile)
+            except OSError:
+                s_target = None
+
+            if s_target is not None and s_src.st_size == s_target.st_size and \
+                    file_digest(srcfile) == file_digest(targetfile):
+                counts['unchanged'] += 1
+                continue
+
+            fd, tmpfile = tempfile.mkstemp(prefix=filename + TMP_INFIX,
+                    dir=targetroot)
+            os.close(fd)
+            try:
+                shutil.copy2(srcfile, tmpfile)
+                if os.name == 'nt' and s_target is not None:
+                    os.remove(targetfile)
+                os.rename(tmpfile, targetfile)
+            except (IOError, OSError):
+                os.remove(tmpfile)
+                raise
+            counts['copied'] += 1
+
+            # bytecode of the old version
+            if targetfile.endswith('.py'):
+                for suffix in ['c', 'o']:
+                    if os.path.exists(targetfile + suffix):
+                        os.remove(targetfile + suffix)
+
+    # remove files (and bytecode of sources) which are not in src
+    for root, dirnames, filenames in os.walk(target, topdown=False):
+        relroot = os.path.relpath(root, target)
+        for filename in filenames:
+            relfile = os.path.normpath(os.path.join(relroot, filename))
+            if relfile in srcfiles:
+                continue
+            if relfile[-4:] in ('.pyc', '.pyo') and relfile[:-1] in srcfiles:
+                continue
+            os.remove(os.path.join(root, filename))
+            counts['removed'] += 1
+        if relroot != '.' and not os.listdir(root):
+            os.rmdir(root)
+
+    for action, n in counts.items():
+        metrics.counter('install_sync_files_total',
+                'Files handled by incremental upgrades').inc(n, action=action)
+
+    return counts
+
+def count_install(outcome):
+    '''
+    Update install metrics (outcome: success, initfailed, failed, cancelled)
+    '''
+    from . import metrics
+    metrics.counter('installs_total', 'Plugin installations').inc(outcome=outcome)
+
+def install_file(ofile, plugdir, confirm):
+    '''
+    Install plugin from file into plugin directory "plugdir", without user
+    interaction (see installPluginFromFile for the interactive version).
+
+    Takes python (.py) files, package directories (__init__.py) and archives
+    which contain a python module.
+
+    confirm(name, pathname, v_new, v_installed) is called before anything
+    gets installed, v_installed is None if no plugin of that name is
+    registered. Installation is cancelled if it returns False.
+
+    If the "install_incremental" preference is set, an existing package
+    directory is upgraded in place by copying only changed files (see
+    sync_directory), instead of being replaced as a whole.
+
+    Returns a (name, mod_file) tuple. Raises InstallationCancelled if
+    cancelled, and other exceptions on failure.
+    '''
+    import shutil
+    from . import PluginInfo, pref_get
+
+    incremental = pref_get('install_incremental', False)
+
+    def remove_if_exists(pathname):
+        '''
+        Remove existing plugin files before reinstallation. Will not remove
+        files if installing into different startup directory.
+        '''
+        if not os.path.exists(pathname):
+            return
+        if os.path.isdir(pathname):
+            shutil.rmtree(pathname)
+        else:
+            os.remove(pathname)
+
+    def check_reinstall(name, pathname, remove=True):
+        '''
+        Confirm (re)installation. Removes the existing files, unless
+        remove=False (they get replaced by swap_directory then).
+        '''
+        from . import plugins
+
+        v_installed = plugins[name].get_version() if name in plugins else None
+        v_new = PluginInfo(name, ofile).get_version()
+
+        if not confirm(name, pathname, v_new, v_installed):
+            raise InstallationCancelled('will not overwrite "%s"' % pathname)
+
+        if remove:
+            remove_if_exists(pathname)
+
+    temppathnames = []
+    try:
+        name, ext = get_name_and_ext(ofile)
+
+        if ext == 'zip' and pref_get('install_zipped', False):
+            # copy archive, plugin gets imported from the archive
+            from .archives import scan_archive, split_archive_path
+            found = scan_archive(ofile)
+            if found is None:
+                raise BadInstallationFile('Archive must contain a single package.')
+            name, member = found[0], os.path.relpath(found[1], ofile)
+            ofile = found[1]
+            archive = os.path.join(plugdir, name + '.zip')
+            check_valid_name(name)
+            check_reinstall(name, archive, False)
+
+            # copy next to the target and rename into place, then remove an
+            # extracted version (the old version stays usable until then)
+            import tempfile
+            fd, tmparchive = tempfile.mkstemp(prefix='.install-',
+                    suffix='.zip', dir=plugdir)
+            os.close(fd)
+            temppathnames.append((tmparchive, 0))
+            shutil.copy(split_archive_path(ofile)[0], tmparchive)
+            os.chmod(tmparchive, 0644)
+            if os.name == 'nt' and os.path.exists(archive):
+                os.remove(archive)
+            os.rename(tmparchive, archive)
+            temppathnames.remove((tmparchive, 0))
+            remove_if_exists(os.path.join(plugdir, name))
+
+            mod_file = os.path.join(archive, member)
+
+        elif ext in zip_extensions:
+            # import archive: extract into a staging directory next to the
+            # target, then swap it into place (the old version stays
+            # usable until then)
+            import tempfile
+            staging = tempfile.mkdtemp(prefix='.install-', dir=plugdir)
+            temppathnames.append((staging, 1))
+            dirnames = extract_archive(ofile, ext, staging)
+
+            # install
+            name = dirnames[-1]
+            odir = os.path.join(staging, *dirnames)
+            ofile = os.path.join(odir, '__init__.py')
+            mod_dir = os.path.join(plugdir, name)
+            check_valid_name(name)
+            check_reinstall(name, mod_dir, False)
+            remove_if_exists(mod_dir + '.zip')
+            if incremental and os.path.isdir(mod_dir):
+                sync_directory(odir, mod_dir)
+            else:
+                swap_directory(odir, mod_dir)
+
+            mod_file = os.path.join(mod_dir, '__init__.py')
+
+        elif name == '__init__':
+            # import directory
+            odir = os.path.dirname(ofile)
+            name = os.path.basename(odir)
+            mod_dir = os.path.join(plugdir, name)
+            incremental = incremental and os.path.isdir(mod_dir)
+            check_reinstall(name, mod_dir, not incremental)
+            check_valid_name(name)
+            if incremental:
+                sync_directory(odir, mod_dir)
+            else:
+                shutil.copytree(odir, mod_dir)
+
+            mod_file = os.path.join(mod_dir, '__init__.py')
+
+        elif ext == 'py':
+            # import python file
+            mod_file = os.path.join(plugdir, name + '.py')
+            check_reinstall(name, mod_file)
+            check_valid_name(name)
+            shutil.copy(ofile, mod_file)
+
+        else:
+            raise UserWarning('this should never happen')
+
+    finally:
+        for (pathname, is_dir) in temppathnames:
+            if is_dir:
+                shutil.rmtree(pathname)
+            else:
+                os.remove(pathname)
+
+    return name, mod_file
+
+def register_installed(name, mod_file):
+    '''
+    Register a freshly installed plugin, replacing the PluginInfo of a
+    previously installed version. Returns the new PluginInfo instance.
+    '''
+    from . import plugins, startup, PluginInfo
+
+    # remove commands and menu items of previously loaded version
+    if name in plugins and plugins[name].loaded:
+        plugins[name].unregister()
+
+    return PluginInfo(name, mod_file, startup.__name__ + '.' + name)
 
 def installPluginFromFile(ofile, parent=None):
     '''
@@ -145,8 +476,6 @@ def installPluginFromFile(ofile, parent=None):
 
     Takes python (.py) files and archives which contain a python module.
     '''
-    import shutil
-    from . import startup, PluginInfo
     from . import get_startup_path, set_startup_path, pref_get
     from .legacysupport import tkMessageBox, get_tk_focused
 
@@ -204,38 +533,16 @@ def installPluginFromFile(ofile, parent=None):
     if plugdir not in plugdirs:
         set_startup_path([plugdir] + plugdirs)
 
-    def remove_if_exists(pathname, ask):
-        '''
-        Remove existing plugin files before reinstallation. Will not remove
-        files if installing into different startup directory.
-        '''
-        if not os.path.exists(pathname):
-            return
-
-        is_dir = os.path.isdir(pathname)
-
-        if ask:
-            if is_dir:
+    def confirm(name, pathname, v_new, v_installed):
+        if v_installed is None:
+            if not os.path.exists(pathname):
+                return True
+            if os.path.isdir(pathname):
                 msg = 'Directory "%s" already exists, overwrite?' % pathname
             else:
                 msg = 'File "%s" already exists, overwrite?' % pathname
-            if not tkMessageBox.askyesno('Confirm', msg, parent=parent):
-                raise InstallationCancelled('will not overwrite "%s"' % pathname)
+            return askyesno('Confirm', msg, parent=parent)
 
-        if is_dir:
-            shutil.rmtree(pathname)
-        else:
-            os.remove(pathname)
-
-    def check_reinstall(name, pathname):
-        from . import plugins
-
-        if name not in plugins:
-            remove_if_exists(pathname, True)
-            return
-
-        v_installed = plugins[name].get_version()
-        v_new = PluginInfo(name, ofile).get_version()
         c = cmp_version(v_new, v_installed)
         if c > 0:
             msg = 'An older version (%s) of this plugin is already installed. Install version %s now?' % (v_installed, v_new)
@@ -244,77 +551,31 @@ def installPluginFromFile(ofile, parent=None):
         else:
             msg = 'A newer version (%s) of this plugin is already installed. Install anyway?' % (v_installed)
 
-        if not tkMessageBox.askokcancel('Confirm', msg, parent=parent):
-            raise InstallationCancelled
+        return tkMessageBox.askokcancel('Confirm', msg, parent=parent)
 
-        remove_if_exists(pathname, False)
-
-    temppathnames = []
+    name = os.path.basename(ofile).split('.')[0]
     try:
-        name, ext = get_name_and_ext(ofile)
-
-        if ext in zip_extensions:
-            # import archive
-
-            tempdir, dirnames = extract_zipfile(ofile, ext)
-            temppathnames.append((tempdir, 1))
-
-            # install
-            name = dirnames[-1]
-            odir = os.path.join(tempdir, *dirnames)
-            ofile = os.path.join(odir, '__init__.py')
-            mod_dir = os.path.join(plugdir, name)
-            check_reinstall(name, mod_dir)
-            check_valid_name(name)
-            shutil.copytree(odir, mod_dir)
-
-            mod_file = os.path.join(mod_dir, '__init__.py')
-
-        elif name == '__init__':
-            # import directory
-            odir = os.path.dirname(ofile)
-            name = os.path.basename(odir)
-            mod_dir = os.path.join(plugdir, name)
-            check_reinstall(name, mod_dir)
-            check_valid_name(name)
-            shutil.copytree(odir, mod_dir)
-
-            mod_file = os.path.join(mod_dir, '__init__.py')
-
-        elif ext == 'py':
-            # import python file
-            mod_file = os.path.join(plugdir, name + '.py')
-            check_reinstall(name, mod_file)
-            check_valid_name(name)
-            shutil.copy(ofile, mod_file)
-
-        else:
-            raise UserWarning('this should never happen')
+        name, mod_file = install_file(ofile, plugdir, confirm)
 
     except InstallationCancelled:
+        count_install('cancelled')
         showinfo('Info', 'Installation cancelled', parent=parent)
         return
 
     except:
+        count_install('failed')
         if pref_get('verbose', False):
             import traceback
             traceback.print_exc()
         showinfo('Error', 'unable to install plugin "%s"' % name, parent=parent)
         return
 
-    finally:
-        for (pathname, is_dir) in temppathnames:
-            if is_dir:
-                shutil.rmtree(pathname)
-            else:
-                os.remove(pathname)
-
-    prefix = startup.__name__
-    info = PluginInfo(name, mod_file, prefix + '.' + name)
-
+    info = register_installed(name, mod_file)
     if info.load(force=1):
+        count_install('success')
         showinfo('Success', 'Plugin "%s" has been installed.' % name, parent=parent)
     else:
+        count_install('initfailed')
         showinfo('Error', 'Plugin "%s" has been installed but initialization failed.' % name, parent=parent)
 
     if info.get_citation_required():
@@ -324,4 +585,283 @@ def installPluginFromFile(ofile, parent=None):
             from .managergui import plugin_info_dialog
             plugin_info_dialog(parent, info)
 
+# headless installation
+
+install_policies = ['upgrade', 'reinstall', 'force', 'keep']
+
+def make_policy_confirm(policy, pinned=None):
+    '''
+    Returns a confirm callback for install_file which decides by policy
+    instead of asking:
+
+    upgrade:   install if not installed or if the new version is newer
+    reinstall: install if not installed or if the new version is not older
+    force:     always install
+    keep:      only install if not installed (and no files exist)
+
+    If "pinned" is given, the version of the file must match it exactly
+    (string comparison, numbers are converted to strings).
+    '''
+    if policy not in install_policies:
+        raise ValueError('policy must be one of: ' + ', '.join(install_policies))
+
+    if pinned is not None:
+        pinned = str(pinned).strip()
+
+    def confirm(name, pathname, v_new, v_installed):
+        # exact match, cmp_version treats unparsable versions as equal
+        if pinned and v_new.strip() != pinned:
+            raise BadInstallationFile('version %s does not match pinned '
+                    'version %s' % (v_new or '(none)', pinned))
+
+        if v_installed is None:
+            if policy == 'keep' and os.path.exists(pathname):
+                raise InstallationCancelled('files exist: ' + pathname)
+            return True
+
+        c = cmp_version(v_new, v_installed)
+        if policy == 'keep' or \
+                policy == 'upgrade' and c <= 0 or \
+                policy == 'reinstall' and c < 0:
+            raise InstallationCancelled('installed version: ' + v_installed)
+        return True
+
+    return confirm
+
+def resolve_manifest_entry(entry, repositories, listings, tempdir):
+    '''
+    Resolve a manifest entry to a local filename. Repository entries get
+    downloaded into tempdir. "listings" is a cache {url: filenames}.
+
+    Returns (filename, pinned version or None)
+    '''
+    import tempfile
+    from .repository import guess
+
+    if isinstance(entry, basestring):
+        entry = {'file': entry} if os.path.exists(os.path.expanduser(entry)) \
+                else {'name': entry}
+    elif not isinstance(entry, dict) or not ('file' in entry or 'name' in entry):
+        raise BadInstallationFile('invalid manifest entry: %r' % (entry,))
+
+    # JSON manifests may give versions as numbers
+    pinned = entry.get('version')
+    if pinned is not None:
+        pinned = str(pinned)
+
+    if 'file' in entry:
+        return os.path.expanduser(entry['file']), pinned
+
+    name = entry['name']
+    urls = [entry['repository']] if 'repository' in entry else repositories
+
+    for url in urls:
+        if url not in listings:
+            listings[url] = guess(url).list()
+
+        candidates = []
+        for filename in listings[url]:
+            try:
+                if get_name_and_ext(filename)[0] == name:
+                    candidates.append(filename)
+            except BadInstallationFile:
+                pass
+        if not candidates:
+            continue
+
+        # prefer files with the pinned version (from the repository index, or
+        # archives which carry the version in their name)
+        if pinned:
+            candidates.sort(key=lambda f: getattr(f, 'version', None) != pinned
+                    and ('-' + pinned + '.') not in f)
+
+        dirname = tempfile.mkdtemp(dir=tempdir)
+        guess(url).copy(candidates[0], dirname)
+        return os.path.join(dirname, os.path.basename(candidates[0])), pinned
+
+    raise BadInstallationFile('plugin "%s" not found in repositories' % name)
+
+def install_manifest(manifest, plugdir=None, policy=None, threads=None,
+        load=False):
+    '''
+    Install plugins from a manifest without user interaction.
+
+    manifest: dictionary (or JSON filename) with keys
+        plugins: list of entries, each either a filename, a plugin name
+            (looked up in the repositories), or a dictionary with "file" or
+            "name", and optional "version" (pinned) and "repository"
+        repositories: list of repository urls (optional)
+        plugindir: plugin directory (optional, default: user plugin dir)
+        policy: see make_policy_confirm (optional, default: upgrade)
+
+    Entries are resolved and installed concurrently (threads), then
+    registered and (if load=True) loaded.
+
+    Returns a report dictionary with a "results" list.
+    '''
+    import time
+    import shutil
+    import tempfile
+    from . import get_startup_path, set_startup_path, pref_get
+
+    if isinstance(manifest, basestring):
+        import json
+        from . import _str_recursive
+        f = open(manifest)
+        try:
+            manifest = _str_recursive(json.load(f))
+        finally:
+            f.close()
+
+    plugdir = os.path.expanduser(plugdir or manifest.get('plugindir')
+            or get_default_user_plugin_path())
+    policy = policy or manifest.get('policy', 'upgrade')
+    threads = int(threads or pref_get('install_threads', 4))
+    repositories = manifest.get('repositories', [])
+
+    make_policy_confirm(policy) # validate
+
+    if not os.path.exists(plugdir):
+        os.makedirs(plugdir)
+    plugdirs = get_startup_path()
+    if plugdir not in plugdirs:
+        set_startup_path([plugdir] + plugdirs)
+
+    listings = {}
+    tempdir = tempfile.mkdtemp()
+
+    def install_entry(entry):
+        start = time.time()
+        result = {'source': entry, 'status': 'failed', 'name': None,
+                'error': None}
+        try:
+            filename, pinned = resolve_manifest_entry(entry, repositories,
+                    listings, tempdir)
+            result['pinned'] = pinned
+            result['name'], result['file'] = install_file(filename, plugdir,
+                    make_policy_confirm(policy, pinned))
+            result['status'] = 'installed'
+        except InstallationCancelled as e:
+            result['status'] = 'skipped'
+            result['error'] = str(e)
+        except Exception as e:
+            result['error'] = '%s: %s' % (e.__class__.__name__, e)
+        result['seconds'] = time.time() - start
+        return result
+
+    entries = manifest.get('plugins', [])
+
+    try:
+        if threads > 1 and len(entries) > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(threads, len(entries)))
+            results = pool.map(install_entry, entries)
+            pool.close()
+        else:
+            results = map(install_entry, entries)
+    finally:
+        shutil.rmtree(tempdir, True)
+
+    from . import plugins
+
+    infos = []
+    for result in results:
+        count_install({'installed': 'success', 'skipped': 'cancelled',
+            'failed': 'failed'}[result['status']])
+        if result['status'] == 'installed':
+            old = plugins.get(result['name'])
+            if not load and old is not None and old.loaded:
+                # leave the running version alone
+                result['note'] = 'new version active after restart or plugin_reload'
+                continue
+            info = register_installed(result['name'], result['file'])
+            result['version'] = info.get_version()
+            infos.append(info)
+
+    if load and infos:
+        from . import loadPluginsByRequires
+
+        # modules of upgraded plugins are already imported and need a reload,
+        # which is not done by loadPluginsByRequires
+        reloads = [item for item in infos if item.module is not None]
+        loaded = [(item, item.load(None, force=1)) for item in reloads]
+        loaded += loadPluginsByRequires([item for item in infos
+            if item not in reloads], None)
+
+        for info, success in loaded:
+            if not success:
+                for result in results:
+                    if result['name'] == info.name:
+                        result['status'] = 'initfailed'
+                        result['error'] = info.error
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+
+    return {
+        'plugindir': plugdir,
+        'policy': policy,
+        'results': results,
+        'summary': summary,
+    }
+
+def plugin_install_manifest(filename, plugindir='', policy='', report='',
+        load=0, quiet=0):
+    '''
+DESCRIPTION
+
+    Install plugins from a JSON manifest without any dialogs, e.g. for
+    provisioning many workstations.
+
+    Example manifest:
+
+    {
+      "plugindir": "~/.pymol/startup",
+      "policy": "upgrade",
+      "repositories": ["https://github.com/Pymol-Scripts/Pymol-script-repo"],
+      "plugins": [
+        "/shared/plugins/foo.py",
+        {"file": "/shared/plugins/bar-1.2.zip", "version": "1.2"},
+        {"name": "baz", "version": "0.9"}
+      ]
+    }
+
+USAGE
+
+    plugin_install_manifest filename [, plugindir [, policy [, report [, load ]]]]
+
+ARGUMENTS
+
+    filename = string: JSON manifest
+
+    plugindir = string: plugin directory {default: from manifest, or user
+    plugin directory}
+
+    policy = upgrade|reinstall|force|keep: what to do if a plugin is
+    already installed {default: from manifest, or upgrade}
+
+    report = string: write JSON report to this file {default: }
+
+    load = 0/1: load installed plugins {default: 0}
+    '''
+    from pymol import cmd
+
+    result = install_manifest(cmd.exp_path(filename), plugindir and
+            cmd.exp_path(plugindir), policy, load=int(load))
+
+    if report:
+        import json
+        from . import write_file_atomic
+        write_file_atomic(cmd.exp_path(report), json.dumps(result, indent=1))
+
+    if not int(quiet):
+        for r in result['results']:
+            print ' %-24s %-10s %s' % (r['name'] or r['source'], r['status'],
+                    r['error'] or r.get('note', ''))
+        print ' ' + ', '.join('%d %s' % (n, status)
+                for (status, n) in sorted(result['summary'].items()))
+
+    return result
+
 # vi:expandtab:smarttab:sw=4
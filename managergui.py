@@ -10,6 +10,7 @@ import Pmw
 import Tkinter
 from .legacysupport import tkMessageBox, tkFileDialog
 from . import pref_get
+from .profiling import get_load_memory, format_size
 
 default_pad = {'padx': 5, 'pady': 5}
 default_top = {'fill': 'x', 'anchor': 'n', 'side': 'top'}
@@ -38,7 +39,9 @@ def manager_dialog():
     Create the Plugin Manager dialog (with Pmw)
     '''
     from .legacysupport import get_tk_root
-    dialog = PluginManager(get_tk_root())
+    from . import tracing
+    with tracing.span('manager_dialog', 'gui'):
+        dialog = PluginManager(get_tk_root())
 
 def plugin_info_dialog(parent, info):
     '''
@@ -149,6 +152,12 @@ class PluginManager(Pmw.MegaToplevel):
         Tkinter.Button(f_all, text='startup all', command=f_installed.startup_all).pack(side='left')
         Tkinter.Button(f_all, text='startup none', command=f_installed.startup_none).pack(side='left')
 
+        def c_rescan():
+            from . import rescan
+            rescan(pmgapp=None)
+            f_installed.reload()
+        Tkinter.Button(f_all, text='Rescan', command=c_rescan).pack(side='right')
+
         # pack
         f_filter.pack(**default_top)
         f_all.pack(side='bottom', anchor='w', **default_pad)
@@ -224,6 +233,7 @@ class PluginManager(Pmw.MegaToplevel):
         pane_right = pw.add('right', min=.2, max=.5)
 
         repo_tmp = Scratch_Storage()
+        repo_tmp.entries = {}
         def selecmd_left():
             '''
             Get plugins listing for selected repository.
@@ -232,26 +242,42 @@ class PluginManager(Pmw.MegaToplevel):
                 return
 
             from .repository import guess
+            from . import tracing
             sels = slb_left.getcurselection()
             if len(sels) == 0:
                 slb_right.setlist(['- empty -'])
                 return
             try:
                 url = sels[0]
-                repo_tmp.r = guess(url)
-                slb_right.setlist(repo_tmp.r.list())
+                with tracing.span('repository list ' + url, 'gui'):
+                    repo_tmp.r = guess(url)
+                    names = repo_tmp.r.list()
+                    # listbox selections are plain strings, keep the index
+                    # entries (with metadata) for lookup
+                    repo_tmp.entries = dict((name, name) for name in names)
+                    slb_right.setlist(names)
             except:
                 slb_right.setlist(['- listing failed -'])
 
         def infocmd_right():
             '''
-            Download file, parse for metadata, show info-popup and delete file
+            Show info-popup. Metadata comes from the repository index or the
+            file header if available, otherwise download file, parse for
+            metadata and delete file.
             '''
             from . import PluginInfo
             from .installation import get_name_and_ext, extract_zipfile, zip_extensions
             sels = slb_right.getcurselection()
             if len(sels) == 0:
                 return
+            try:
+                info = repo_tmp.r.get_plugin_info(repo_tmp.entries.get(sels[0],
+                    sels[0]))
+            except:
+                info = None
+            if info is not None:
+                plugin_info_dialog(self.interior(), info)
+                return
             import tempfile, shutil, os
             tmpdir = tempfile.mkdtemp()
             tmpdirs = [tmpdir]
@@ -284,7 +310,7 @@ class PluginManager(Pmw.MegaToplevel):
             import tempfile, shutil, os
             tmpdir = tempfile.mkdtemp()
             try:
-                name = sels[0]
+                name = repo_tmp.entries.get(sels[0], sels[0])
                 repo_tmp.r.copy(name, tmpdir)
                 filename = os.path.join(tmpdir, name)
                 installPluginFromFile(filename, self.interior())
@@ -338,6 +364,7 @@ class PluginManager(Pmw.MegaToplevel):
             set_startup_path(items)
             slb_path.setlist(items)
             self.b_save.configure(background='red')
+            self.f_installed.reload()
 
         def slb_path_add():
             import os
@@ -385,7 +412,8 @@ class PluginManager(Pmw.MegaToplevel):
         bb_path.pack(side='top', fill='x')
 
         l_path = Tkinter.Label(w.interior(),
-                text='PyMOL restart required in order to find plugins in modified plugin search path')
+                text='Plugins in added directories are loaded immediately, '
+                'removed directories take effect after PyMOL restart for already loaded plugins')
         l_path.pack(**default_top)
 
         w = Pmw.Group(page, tag_text='Preferences (Read-Only)')
@@ -489,16 +517,20 @@ class InstalledPluginsWidget(Pmw.ScrolledFrame):
         bind_rec(self)
 
     def startup_all(self):
-        for child in self.children():
-            child.w_startup.select()
-            if not child.info.autoload:
-                child.c_startup(False)
+        from . import pref_batch
+        with pref_batch():
+            for child in self.children():
+                child.w_startup.select()
+                if not child.info.autoload:
+                    child.c_startup(False)
 
     def startup_none(self):
-        for child in self.children():
-            child.w_startup.deselect()
-            if child.info.autoload:
-                child.c_startup(False)
+        from . import pref_batch
+        with pref_batch():
+            for child in self.children():
+                child.w_startup.deselect()
+                if child.info.autoload:
+                    child.c_startup(False)
 
 class PluginWidget(Tkinter.Frame):
     '''
@@ -589,6 +621,9 @@ class PluginWidget(Tkinter.Frame):
 
         if self.info.loaded:
             text = 'Took %.3f seconds to load' % (self.info.loadtime)
+            memory = get_load_memory(self.info)
+            if memory is not None:
+                text += ', memory at load: ' + format_size(memory)
             self.w_loadtime.config(text=text)
             self.w_enable.config(state=Tkinter.DISABLED)
 
@@ -598,4 +633,7 @@ class PluginWidget(Tkinter.Frame):
                 Tkinter.Button(self.f_settings, text='Settings',
                         command=self.info.module.settings_dialog).pack()
 
+        elif self.info.stubs:
+            self.w_loadtime.config(text='Will be loaded on first use')
+
 # vi:expandtab:smarttab:sw=4:nowrap
@@ -0,0 +1,196 @@
+'''
+PyMOL Plugins Engine, Metrics
+
+Process-wide registry of counters and histograms (plugins scanned, loaded
+and failed, load latency, preference writes, repository requests, bytes
+downloaded, cache hits). The registry can be exported in the Prometheus
+text format (e.g. for the node exporter's textfile collector) and as a JSON
+snapshot, on demand or on exit (see "metrics_prometheus_file" and
+"metrics_json_file" preferences).
+
+Usage:
+
+    from pymolplugins import metrics
+    metrics.counter('plugins_loaded_total', 'Loaded plugins').inc()
+    metrics.histogram('plugin_load_seconds', 'Load time').observe(0.1, plugin='foo')
+
+License: BSD-2-Clause
+
+'''
+
+import os
+import threading
+
+PREFIX = 'pymolplugins_'
+
+# default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0)
+
+def _labels_key(labels):
+    return tuple(sorted(labels.iteritems()))
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join('%s="%s"' % (k, str(v).replace('\\', '\\\\')
+        .replace('"', '\\"').replace('\n', '\\n')) for (k, v) in items) + '}'
+
+class Counter(object):
+    '''
+    Monotonically increasing value, optionally with labels.
+    '''
+    type = 'counter'
+
+    def __init__(self, name, help=''):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, value=1, **labels):
+        key = _labels_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def get(self, **labels):
+        return self.values.get(_labels_key(labels), 0)
+
+    def prometheus_lines(self):
+        return ['%s%s %s' % (self.name, _format_labels(key), value)
+                for (key, value) in sorted(self.values.items())]
+
+    def snapshot(self):
+        return [{'labels': dict(key), 'value': value}
+                for (key, value) in sorted(self.values.items())]
+
+class Histogram(object):
+    '''
+    Distribution of observed values in cumulative buckets, optionally with
+    labels.
+    '''
+    type = 'histogram'
+
+    def __init__(self, name, help='', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}    # key -> [bucket counts, sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _labels_key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def prometheus_lines(self):
+        lines = []
+        for (key, (counts, total, count)) in sorted(self.values.items()):
+            for bound, n in zip(self.buckets, counts):
+                lines.append('%s_bucket%s %d' % (self.name,
+                    _format_labels(key, [('le', repr(bound))]), n))
+            lines.append('%s_bucket%s %d' % (self.name,
+                _format_labels(key, [('le', '+Inf')]), count))
+            lines.append('%s_sum%s %r' % (self.name, _format_labels(key), total))
+            lines.append('%s_count%s %d' % (self.name, _format_labels(key), count))
+        return lines
+
+    def snapshot(self):
+        return [{'labels': dict(key), 'buckets': dict(zip(self.buckets, counts)),
+            'sum': total, 'count': count}
+            for (key, (counts, total, count)) in sorted(self.values.items())]
+
+class Registry(object):
+    '''
+    Collection of named metrics.
+    '''
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def _get(self, cls, name, *args):
+        name = PREFIX + name
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = cls(name, *args)
+            elif not isinstance(metric, cls):
+                raise TypeError('metric %s is a %s' % (name, metric.type))
+        return metric
+
+    def counter(self, name, help=''):
+        return self._get(Counter, name, help)
+
+    def histogram(self, name, help='', buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, buckets)
+
+    def prometheus_text(self):
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            if metric.help:
+                lines.append('# HELP %s %s' % (name, metric.help))
+            lines.append('# TYPE %s %s' % (name, metric.type))
+            lines.extend(metric.prometheus_lines())
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self):
+        return dict((name, {'type': metric.type, 'help': metric.help,
+            'values': metric.snapshot()})
+            for (name, metric) in self.metrics.items())
+
+registry = Registry()
+counter = registry.counter
+histogram = registry.histogram
+
+def write_prometheus(filename):
+    '''
+    Write all metrics in Prometheus text exposition format (atomically, as
+    required by the textfile collector).
+    '''
+    from . import write_file_atomic
+    write_file_atomic(filename, registry.prometheus_text())
+
+def write_json(filename):
+    '''
+    Write JSON snapshot of all metrics.
+    '''
+    import json
+    import time
+    from . import write_file_atomic
+    data = {'time': time.time(), 'metrics': registry.snapshot()}
+    write_file_atomic(filename, json.dumps(data, indent=1, sort_keys=True))
+
+def export_on_exit():
+    '''
+    Write metrics to the files given by the "metrics_prometheus_file" and
+    "metrics_json_file" preferences (if set). Registered with atexit.
+    '''
+    from pymol import cmd
+    from . import pref_get
+
+    for key, func in [
+            ('metrics_prometheus_file', write_prometheus),
+            ('metrics_json_file', write_json)]:
+        filename = pref_get(key)
+        if not filename:
+            continue
+        # several PyMOL instances per node can use "%(pid)s" in the filename
+        if '%(pid)s' in filename:
+            filename = filename % {'pid': os.getpid()}
+        filename = cmd.exp_path(filename)
+        try:
+            func(filename)
+        except (IOError, OSError):
+            print ' Plugin-Warning: Cannot write metrics to', filename
+
+import atexit
+atexit.register(export_on_exit)
+
+# vi:expandtab:smarttab:sw=4
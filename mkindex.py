@@ -0,0 +1,69 @@
+'''
+PyMOL Plugins Engine, Repository Index Generator
+
+Builds the repository index files for a directory of plugins (.py, .zip,
+.tar.gz): "pluginindex.txt" (list of filenames) and "pluginindex.json"
+(filenames with version, size, sha256, mtime, header metadata and
+docstring, see repository.parse_index_json).
+
+Files are inspected in parallel worker processes. An existing
+pluginindex.json is reused for files whose size and mtime did not change.
+The index is built by pluginfile.make_index, this module is only the
+command line entry point.
+
+This tool does not need PyMOL. Run it as a script, which does not execute
+the package __init__ (the plugin engine):
+
+    python pymolplugins/mkindex.py [-j PROCESSES] [--full] DIR
+
+License: BSD-2-Clause
+
+'''
+
+import os
+import sys
+
+def main(argv=None):
+    import argparse
+    from .pluginfile import make_index
+
+    parser = argparse.ArgumentParser(
+            description='Build repository index files for a plugin directory')
+    parser.add_argument('dirname', help='directory with plugin files')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+            help='number of worker processes (default: number of CPUs)')
+    parser.add_argument('--full', action='store_true',
+            help='inspect all files, ignore existing index')
+    parser.add_argument('-q', '--quiet', action='store_true')
+    args = parser.parse_args(argv)
+
+    make_index(args.dirname, args.processes, args.full, args.quiet)
+
+def _init_package():
+    '''
+    When run as a script: Register the directory of this file as a package
+    without executing its __init__ (which starts the plugin engine and needs
+    PyMOL), so that the relative imports of the PyMOL independent modules
+    (installation, archives, pluginfile) work.
+    '''
+    import imp
+    global __package__
+
+    dirname = os.path.dirname(os.path.abspath(__file__))
+    name = os.path.basename(dirname)
+    if name not in sys.modules:
+        package = imp.new_module(name)
+        package.__path__ = [dirname]
+        sys.modules[name] = package
+    __package__ = name
+
+# run as a script. Also true in multiprocessing children which import this
+# file without running the __main__ block (spawn start method on Windows),
+# they need the package to unpickle the pool worker.
+if '.' not in __name__:
+    _init_package()
+
+if __name__ == '__main__':
+    main()
+
+# vi:expandtab:smarttab:sw=4
@@ -0,0 +1,265 @@
+'''
+PyMOL Plugins Engine, Plugin File Parsing
+
+Helpers which parse plugin source files (metadata comment block, docstring),
+write files atomically, and build the index files of a plugin repository
+directory ("pluginindex.txt" and "pluginindex.json", see mkindex). This
+module does not import PyMOL, so tools like mkindex can use it on hosts
+without PyMOL.
+
+License: BSD-2-Clause
+
+'''
+
+import os
+import tempfile
+
+# temporary files of write_file_atomic are named <filename><TMP_INFIX>XXXXXX
+TMP_INFIX = '.tmp'
+
+# repository index files
+INDEX_JSON_FILENAME = 'pluginindex.json'
+INDEX_TXT_FILENAME = 'pluginindex.txt'
+
+# increment if the layout of pluginindex.json changes incompatibly
+INDEX_VERSION = 1
+
+def parse_metadata(lines):
+    '''
+    Parse metadata from the hash-commented block at the beginning of a
+    plugin file (iterable of lines).
+
+    Returns a (metadata, complete) tuple, complete is False if the lines
+    ended inside the comment block.
+    '''
+    metadata = dict()
+    for line in lines:
+        if line.strip() == '':
+            continue
+        if not line.startswith('#'):
+            return metadata, True
+        if ':' in line:
+            key, value = line[1:].split(':', 1)
+            metadata[key.strip()] = value.strip()
+    return metadata, False
+
+def parse_docstring(content, complete=True):
+    '''
+    Get the docstring (first statement, if it's a string literal) from
+    python source without executing any code.
+
+    Returns a (docstring, done) tuple, done is False if content is
+    incomplete and ends before the first statement.
+    '''
+    import tokenize
+    from cStringIO import StringIO
+
+    skip = (tokenize.COMMENT, tokenize.NL, tokenize.NEWLINE, tokenize.INDENT)
+    try:
+        for token in tokenize.generate_tokens(StringIO(content).readline):
+            if token[0] in skip:
+                continue
+            if token[0] == tokenize.STRING:
+                import ast
+                return ast.literal_eval(token[1]), True
+            if token[0] == tokenize.ENDMARKER:
+                break
+            return None, True
+    except (tokenize.TokenError, SyntaxError, ValueError):
+        pass
+    return None, complete
+
+def parse_header(content, complete=True):
+    '''
+    Parse metadata and docstring from the beginning of a python plugin file.
+    If complete=False, content may be cut off anywhere.
+
+    Returns (metadata, docstring, done), done is False if more content is
+    needed.
+    '''
+    if not complete:
+        # only complete lines
+        content = content[:content.rfind('\n') + 1]
+
+    metadata, done_metadata = parse_metadata(content.splitlines(True))
+    docstring, done_docstring = parse_docstring(content, complete)
+
+    return metadata, docstring, complete or (done_metadata and done_docstring)
+
+def write_file_atomic(filename, content, mode='w'):
+    '''
+    Write content to a temporary file in the same directory and rename it
+    to filename, so that readers never see a partially written file.
+    Raises IOError or OSError on failure.
+    '''
+    # unique name per call, concurrent writers (threads) must not share it
+    dirname, basename = os.path.split(filename)
+    fd, tmpfilename = tempfile.mkstemp(prefix=basename + TMP_INFIX,
+            dir=dirname or '.')
+    try:
+        f = os.fdopen(fd, mode)
+        try:
+            f.write(content)
+        finally:
+            f.close()
+        # mkstemp creates the file private (0600)
+        try:
+            permissions = os.stat(filename).st_mode & 0777
+        except OSError:
+            permissions = 0644
+        os.chmod(tmpfilename, permissions)
+        if os.name == 'nt' and os.path.exists(filename):
+            os.remove(filename)
+        os.rename(tmpfilename, filename)
+    except (IOError, OSError):
+        os.remove(tmpfilename)
+        raise
+
+def inspect_file(filename):
+    '''
+    Returns the index item (dictionary) for a plugin file, like
+    installation would see it. Raises BadInstallationFile (or IOError) if
+    the file is not a valid plugin.
+    '''
+    import hashlib
+    import shutil
+    from .installation import get_name_and_ext, extract_zipfile, zip_extensions
+
+    s = os.stat(filename)
+    name, ext = get_name_and_ext(filename)
+
+    f = open(filename, 'rb')
+    try:
+        content = f.read()
+    finally:
+        f.close()
+    sha256 = hashlib.sha256(content).hexdigest()
+
+    if ext in zip_extensions:
+        tempdir, dirnames = extract_zipfile(filename, ext)
+        try:
+            name = dirnames[-1]
+            f = open(os.path.join(tempdir, *dirnames + ('__init__.py',)), 'rb')
+            try:
+                content = f.read()
+            finally:
+                f.close()
+        finally:
+            shutil.rmtree(tempdir)
+
+    metadata, docstring = parse_header(content)[:2]
+
+    return {
+        'filename': os.path.basename(filename),
+        'name': name,
+        'version': metadata.get('Version', ''),
+        'size': s.st_size,
+        'sha256': sha256,
+        'mtime': s.st_mtime,
+        'metadata': metadata,
+        'docstring': docstring,
+    }
+
+def inspect_worker(filename):
+    '''
+    Pool worker for make_index (module level, so that it can be pickled):
+    returns (basename, item or None, error message or None)
+    '''
+    import tarfile
+    import zipfile
+    from .installation import BadInstallationFile
+    basename = os.path.basename(filename)
+    try:
+        return basename, inspect_file(filename), None
+    except (BadInstallationFile, IOError, OSError, ValueError,
+            zipfile.BadZipfile, tarfile.TarError) as e:
+        return basename, None, str(e)
+
+def load_index(dirname):
+    '''
+    Returns {filename: item} from an existing pluginindex.json, or an empty
+    dictionary.
+    '''
+    import json
+
+    try:
+        f = open(os.path.join(dirname, INDEX_JSON_FILENAME))
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+        return {}
+    return dict((item['filename'], item) for item in data.get('plugins', ())
+            if item.get('filename'))
+
+def list_plugin_files(dirname):
+    '''
+    Names of plugin files (by extension) in dirname.
+    '''
+    from .installation import supported_extensions
+    return sorted(name for name in os.listdir(dirname)
+            if name[:1] not in ('', '.', '_') and
+            name.endswith(tuple('.' + ext for ext in supported_extensions)) and
+            os.path.isfile(os.path.join(dirname, name)))
+
+def make_index(dirname, processes=None, full=False, quiet=0):
+    '''
+    Write pluginindex.txt and pluginindex.json for the plugins in dirname.
+
+    processes: number of worker processes {default: number of CPUs}
+    full: inspect all files, ignore the existing index
+
+    Returns a (number of plugins, number of inspected files) tuple.
+    '''
+    import json
+
+    old = {} if full else load_index(dirname)
+
+    items = {}
+    pending = []
+    for name in list_plugin_files(dirname):
+        filename = os.path.join(dirname, name)
+        s = os.stat(filename)
+        item = old.get(name)
+        if item is not None and item.get('size') == s.st_size and \
+                item.get('mtime') == s.st_mtime:
+            items[name] = item
+        else:
+            pending.append(filename)
+
+    if len(pending) > 1 and processes != 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(processes)
+        try:
+            results = pool.map(inspect_worker, pending)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(inspect_worker, pending)
+
+    for (name, item, error) in results:
+        if item is None:
+            if not quiet:
+                print ' Warning: skipping %s: %s' % (name, error)
+            continue
+        items[name] = item
+
+    plugins = [items[name] for name in sorted(items)]
+
+    write_file_atomic(os.path.join(dirname, INDEX_TXT_FILENAME),
+            ''.join(item['filename'] + '\n' for item in plugins))
+    write_file_atomic(os.path.join(dirname, INDEX_JSON_FILENAME),
+            json.dumps({'version': INDEX_VERSION, 'plugins': plugins},
+                indent=1, sort_keys=True))
+
+    if not quiet:
+        print ' %d plugins indexed, %d files inspected' % (len(plugins),
+                len(pending))
+
+    return len(plugins), len(pending)
+
+# vi:expandtab:smarttab:sw=4
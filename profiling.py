@@ -0,0 +1,388 @@
+'''
+PyMOL Plugins Engine, Profiling
+
+Per-plugin breakdown of loading time (import and initialization), of the
+modules which each plugin pulled in, and of which plugin first imported
+heavy shared dependencies.
+
+Optional memory accounting (set the "profile_memory" preference): Resident
+set size growth during loading, and, if the tracemalloc module is available,
+allocations made from each plugin's own source files with the top allocation
+sites.
+
+License: BSD-2-Clause
+
+'''
+
+# top level packages which are considered expensive to import
+heavy_modules = [
+    'Bio',
+    'matplotlib',
+    'networkx',
+    'numpy',
+    'pandas',
+    'scipy',
+    'sklearn',
+    'sympy',
+]
+
+profile_sort_keys = ['total', 'import', 'init', 'modules', 'name']
+
+memory_sort_keys = ['retained', 'rss', 'traced', 'name']
+
+try:
+    import tracemalloc
+except ImportError:
+    # Python < 3.4 without the pytracemalloc backport
+    tracemalloc = None
+
+def get_rss():
+    '''
+    Returns the resident set size of the current process in bytes, or None
+    if not available (needs /proc or the psutil module).
+    '''
+    import os
+    try:
+        f = open('/proc/self/statm')
+        try:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process(os.getpid()).memory_info().rss
+
+def get_traced_memory():
+    '''
+    Returns the size of the memory blocks currently traced by tracemalloc
+    in bytes, or None if tracemalloc is not tracing.
+    '''
+    if tracemalloc is None or not tracemalloc.is_tracing():
+        return None
+    return tracemalloc.get_traced_memory()[0]
+
+def format_size(size):
+    '''
+    Human readable size (bytes), e.g. "1.2 MB".
+    '''
+    if size is None:
+        return 'n/a'
+    for unit in ['bytes', 'kB', 'MB']:
+        if abs(size) < 1024:
+            break
+        size /= 1024.
+    else:
+        unit = 'GB'
+    if unit == 'bytes':
+        return '%d %s' % (size, unit)
+    return '%.1f %s' % (size, unit)
+
+def is_memory_enabled():
+    from . import pref_get
+    return bool(pref_get('profile_memory', False))
+
+def get_source_patterns(info):
+    '''
+    Filename patterns (fnmatch) of the plugin's source files: the package
+    directory or the module file.
+    '''
+    import os
+    base = os.path.splitext(info.filename)[0]
+    if os.path.basename(base) == '__init__':
+        return [os.path.join(os.path.dirname(base), '*')]
+    return [base + '.py']
+
+def _filter_snapshot(snapshot, info):
+    filters = [tracemalloc.Filter(True, pattern, all_frames=True)
+            for pattern in get_source_patterns(info)]
+    return snapshot.filter_traces(filters)
+
+class measure_memory(object):
+    '''
+    Context manager which adds the resident set size growth and the
+    allocations made from the plugin's source files (if tracemalloc is
+    available) to info.memory. Does nothing unless the "profile_memory"
+    preference is set.
+    '''
+    def __init__(self, info):
+        self.info = info
+        self.active = False
+
+    def __enter__(self):
+        if not is_memory_enabled():
+            return self
+
+        from . import pref_get
+
+        self.active = True
+        self.snapshot = None
+        if tracemalloc is not None:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(pref_get('profile_memory_frames', 10))
+            self.snapshot = _filter_snapshot(tracemalloc.take_snapshot(), self.info)
+        self.rss = get_rss()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if not self.active:
+            return
+
+        from . import pref_get
+
+        rss = get_rss()
+        memory = self.info.memory
+        if memory is None:
+            memory = self.info.memory = {'rss': None, 'traced': None, 'top': []}
+
+        if rss is not None and self.rss is not None:
+            memory['rss'] = (memory['rss'] or 0) + rss - self.rss
+
+        if self.snapshot is not None:
+            snapshot = _filter_snapshot(tracemalloc.take_snapshot(), self.info)
+            stats = snapshot.compare_to(self.snapshot, 'lineno')
+            memory['traced'] = (memory['traced'] or 0) + sum(s.size_diff for s in stats)
+
+            # merge allocation sites with previous phase
+            sites = dict((site, [size, count]) for (site, size, count) in memory['top'])
+            for s in stats:
+                if s.size_diff > 0:
+                    entry = sites.setdefault(str(s.traceback[0]), [0, 0])
+                    entry[0] += s.size_diff
+                    entry[1] += s.count_diff
+            top = sorted(((site, size, count) for (site, (size, count))
+                in sites.items()), key=lambda t: t[1], reverse=True)
+            memory['top'] = top[:pref_get('profile_memory_sites', 10)]
+
+def get_load_memory(info):
+    '''
+    Memory which was allocated while loading the plugin in bytes (traced
+    allocations if available, otherwise RSS growth), or None.
+    '''
+    if info.memory is None:
+        return None
+    if info.memory['traced'] is not None:
+        return info.memory['traced']
+    return info.memory['rss']
+
+def memory_plugins(names=None, sort='retained'):
+    '''
+    Return a list of memory profiles (dictionaries) for the given plugin
+    names (default: all registered plugins) which were loaded with memory
+    accounting enabled, sorted by "sort".
+
+    "retained" is the memory which is currently allocated from the plugin's
+    source files (needs tracemalloc), otherwise the RSS growth at load time.
+    '''
+    from . import plugins
+
+    if sort not in memory_sort_keys:
+        raise ValueError('sort must be one of: ' + ', '.join(memory_sort_keys))
+
+    if names is None:
+        names = plugins.keys()
+
+    snapshot = None
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        snapshot = tracemalloc.take_snapshot()
+
+    profiles = []
+    for name in names:
+        info = plugins.get(name)
+        if info is None or info.memory is None:
+            continue
+        if snapshot is not None:
+            retained = sum(s.size for s in
+                    _filter_snapshot(snapshot, info).statistics('filename'))
+        else:
+            retained = info.memory['rss']
+        profiles.append({
+            'name': info.name,
+            'retained': retained,
+            'rss': info.memory['rss'],
+            'traced': info.memory['traced'],
+            'top': info.memory['top'],
+        })
+
+    if sort == 'name':
+        profiles.sort(key=lambda p: p['name'])
+    else:
+        profiles.sort(key=lambda p: p[sort] or 0, reverse=True)
+
+    return profiles
+
+def format_memory_profiles(profiles, sites=0):
+    '''
+    Format memory profiles as a table, with the top "sites" allocation
+    sites per plugin. Returns a list of lines.
+    '''
+    lines = [' %-24s %12s %12s %12s' % ('plugin', 'retained',
+        'rss at load', 'traced')]
+    for p in profiles:
+        lines.append(' %-24s %12s %12s %12s' % (p['name'],
+            format_size(p['retained']), format_size(p['rss']),
+            format_size(p['traced'])))
+        for (site, size, count) in p['top'][:sites]:
+            lines.append('     %12s %7d blocks  %s' % (format_size(size), count, site))
+    return lines
+
+def get_heavy_modules():
+    from . import pref_get
+    return pref_get('profile_heavy_modules', heavy_modules)
+
+def get_profile(info):
+    '''
+    Return profile of a loaded plugin as a dictionary.
+    '''
+    heavy = set(get_heavy_modules())
+    modules = info.modules
+    first_imported = sorted(set(name.split('.', 1)[0] for name in modules) & heavy)
+
+    return {
+        'name': info.name,
+        'module': info.mod_name,
+        'total': info.loadtime,
+        'import': info.importtime,
+        'init': info.inittime,
+        'modules': len(modules),
+        'module_names': modules,
+        'heavy': first_imported,
+        'memory': info.memory,
+    }
+
+def profile_plugins(names=None, load=False, sort='total'):
+    '''
+    Return a list of profiles (dictionaries, see get_profile) for the given
+    plugin names (default: all registered plugins), sorted by "sort".
+
+    Only loaded plugins are reported. If "load" is True, plugins which are
+    not loaded yet get loaded serially first (module attribution is only
+    accurate for serially loaded plugins).
+    '''
+    from . import plugins
+
+    if sort not in profile_sort_keys:
+        raise ValueError('sort must be one of: ' + ', '.join(profile_sort_keys))
+
+    if names is None:
+        names = plugins.keys()
+
+    infos = [plugins[name] for name in names if name in plugins]
+
+    if load:
+        for info in infos:
+            if not info.loaded:
+                info.load()
+
+    profiles = [get_profile(info) for info in infos if info.loaded]
+    profiles.sort(key=lambda p: p[sort], reverse=(sort != 'name'))
+
+    return profiles
+
+def format_profiles(profiles):
+    '''
+    Format profiles as a table. Returns a list of lines.
+    '''
+    lines = [' %-24s %9s %9s %9s %7s  %s' % ('plugin', 'total[s]',
+        'import[s]', 'init[s]', 'modules', 'heavy dependencies (first import)')]
+    for p in profiles:
+        lines.append(' %-24s %9.3f %9.3f %9.3f %7d  %s' % (p['name'],
+            p['total'], p['import'], p['init'], p['modules'],
+            ', '.join(p['heavy'])).rstrip())
+    if profiles:
+        lines.append(' %-24s %9.3f %9.3f %9.3f %7d' % ('(sum)',
+            sum(p['total'] for p in profiles),
+            sum(p['import'] for p in profiles),
+            sum(p['init'] for p in profiles),
+            sum(p['modules'] for p in profiles)))
+    return lines
+
+def plugin_profile(sort='total', filename='', load=0, quiet=0):
+    '''
+DESCRIPTION
+
+    Report loading time per plugin, split into import time and
+    initialization time (__init_plugin__), the number of modules each
+    plugin pulled in, and heavy dependencies (numpy, scipy, Bio, ...)
+    which were imported first by that plugin.
+
+USAGE
+
+    plugin_profile [ sort [, filename [, load ]]]
+
+ARGUMENTS
+
+    sort = total|import|init|modules|name: sort column {default: total}
+
+    filename = string: dump profiles as JSON to this file {default: }
+
+    load = 0/1: load all registered plugins which are not loaded yet
+    {default: 0}
+    '''
+    from pymol import cmd
+
+    profiles = profile_plugins(load=int(load), sort=sort)
+
+    if filename:
+        import json
+        f = open(cmd.exp_path(filename), 'w')
+        json.dump(profiles, f, indent=1)
+        f.close()
+
+    if not int(quiet):
+        for line in format_profiles(profiles):
+            print line
+
+    return profiles
+
+def plugin_memory(sort='retained', filename='', sites=0, quiet=0):
+    '''
+DESCRIPTION
+
+    Rank plugins by memory. Only plugins which were loaded with memory
+    accounting enabled are reported. To enable it (also for startup):
+    PyMOL> python
+    import pymolplugins
+    pymolplugins.pref_set('profile_memory', True)
+    python end
+
+    If the tracemalloc module is available, allocations are attributed to
+    the source files of each plugin and "retained" is the memory which is
+    still allocated from those files. Otherwise only the resident set size
+    growth while loading is available.
+
+USAGE
+
+    plugin_memory [ sort [, filename [, sites ]]]
+
+ARGUMENTS
+
+    sort = retained|rss|traced|name: sort column {default: retained}
+
+    filename = string: dump memory profiles as JSON to this file {default: }
+
+    sites = int: number of top allocation sites to show per plugin
+    {default: 0}
+    '''
+    from pymol import cmd
+
+    profiles = memory_plugins(sort=sort)
+
+    if filename:
+        import json
+        f = open(cmd.exp_path(filename), 'w')
+        json.dump(profiles, f, indent=1)
+        f.close()
+
+    if not int(quiet):
+        if not profiles:
+            print ' No memory profiles (set the "profile_memory" preference and load plugins)'
+        for line in format_memory_profiles(profiles, int(sites)):
+            print line
+
+    return profiles
+
+# vi:expandtab:smarttab:sw=4
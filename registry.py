@@ -0,0 +1,179 @@
+'''
+PyMOL Plugins Engine, Plugin Registry
+
+Dictionary of registered plugins {name: PluginInfo} with reverse indexes,
+to answer "which plugin provides command X", "which plugin owns module Y"
+and "which plugin owns file Z" without scanning all plugins.
+
+License: BSD-2-Clause
+
+'''
+
+import os
+from .completion import CompletionIndex
+
+def intern_metadata(metadata):
+    '''
+    Returns a copy of the metadata dictionary with interned keys and values,
+    so that the many plugins which share field names and common values
+    ("Author", "License", "BSD-2-Clause", ...) share the string objects.
+    '''
+    return dict((_intern(key), _intern(value))
+            for (key, value) in metadata.iteritems())
+
+def _intern(s):
+    if type(s) is str:
+        return intern(s)
+    return s
+
+def normpath(filename):
+    return os.path.normcase(os.path.abspath(filename))
+
+def is_package_file(filename):
+    '''
+    True if filename is the __init__ file of a package.
+    '''
+    return os.path.splitext(os.path.basename(filename))[0] == '__init__'
+
+class PluginRegistry(dict):
+    '''
+    Dictionary {name: PluginInfo} which maintains indexes by command name,
+    module name and file path. Commands are added and removed by the plugin
+    engine (see add_command, remove_command), modules and files are indexed
+    when a plugin gets registered.
+
+    The "completion" attribute is a persistent completion index of the
+    plugin names (for cmd.auto_arg).
+    '''
+    def __init__(self):
+        dict.__init__(self)
+        self.completion = CompletionIndex(multi=True)
+        self._by_command = {}
+        self._by_module = {}
+        self._by_file = {}
+
+    def _index(self, info):
+        if info.mod_name:
+            self._by_module[info.mod_name] = info
+        filename = normpath(info.filename)
+        self._by_file[filename] = info
+        if is_package_file(filename):
+            self._by_file[os.path.dirname(filename)] = info
+
+    def _unindex(self, info):
+        filename = normpath(info.filename)
+        for (index, keys) in [
+                (self._by_command, set(info.commands) | set(info.stubs)),
+                (self._by_module, [info.mod_name]),
+                (self._by_file, [filename, os.path.dirname(filename)])]:
+            for key in keys:
+                if index.get(key) is info:
+                    del index[key]
+
+    def __setitem__(self, name, info):
+        old = self.get(name)
+        if old is not None and old is not info:
+            self._unindex(old)
+        dict.__setitem__(self, name, info)
+        self._index(info)
+        self.completion.append(name)
+
+    def __delitem__(self, name):
+        self._unindex(self[name])
+        self.completion.remove(name)
+        dict.__delitem__(self, name)
+
+    def pop(self, name, *default):
+        if name in self:
+            self._unindex(self[name])
+            self.completion.remove(name)
+        return dict.pop(self, name, *default)
+
+    def popitem(self):
+        name, info = dict.popitem(self)
+        self._unindex(info)
+        self.completion.remove(name)
+        return name, info
+
+    def clear(self):
+        dict.clear(self)
+        self.completion.rebuild([])
+        self._by_command.clear()
+        self._by_module.clear()
+        self._by_file.clear()
+
+    def update(self, *args, **kwargs):
+        for (name, info) in dict(*args, **kwargs).iteritems():
+            self[name] = info
+
+    def setdefault(self, name, info=None):
+        if name not in self:
+            self[name] = info
+        return self[name]
+
+    # commands
+
+    def add_command(self, name, info):
+        self._by_command[name] = info
+
+    def remove_command(self, name):
+        self._by_command.pop(name, None)
+
+    def get_commands(self):
+        '''
+        Names of all commands (and lazy loading stubs) provided by plugins.
+        '''
+        return self._by_command.keys()
+
+    # lookups
+
+    def find_by_command(self, name):
+        '''
+        Returns the plugin (PluginInfo) which provides command "name", or None.
+        '''
+        return self._by_command.get(name)
+
+    def find_by_module(self, name):
+        '''
+        Returns the plugin which owns module "name" (the plugin module or one
+        of its submodules), or None.
+        '''
+        while name:
+            info = self._by_module.get(name)
+            if info is not None:
+                return info
+            name = name.rpartition('.')[0]
+        return None
+
+    def find_by_file(self, filename):
+        '''
+        Returns the plugin which owns the given file (the plugin module file,
+        or any file inside a package plugin directory), or None.
+        '''
+        filename = normpath(filename)
+        base, ext = os.path.splitext(filename)
+        if ext in ('.pyc', '.pyo'):
+            filename = base + '.py'
+        while True:
+            info = self._by_file.get(filename)
+            if info is not None:
+                return info
+            parent = os.path.dirname(filename)
+            if parent == filename:
+                return None
+            filename = parent
+
+    def find_by_traceback(self, tb):
+        '''
+        Returns the plugin of the innermost frame of traceback "tb" which
+        belongs to a plugin, or None. For attribution of errors.
+        '''
+        info = None
+        while tb is not None:
+            found = self.find_by_file(tb.tb_frame.f_code.co_filename)
+            if found is not None:
+                info = found
+            tb = tb.tb_next
+        return info
+
+# vi:expandtab:smarttab:sw=4
@@ -11,20 +11,312 @@ import urllib2
 from urllib2 import URLError
 
 from .installation import supported_extensions
+from . import tracing
+from . import httpcache
+from . import metrics
+from .pluginfile import parse_header, INDEX_VERSION
 
-def urlopen(url):
+def count_download(content):
     '''
-    urlopen wrapper with timeout from preferences ("network_timeout").
+    Update network metrics for downloaded content (string), returns content.
+    '''
+    metrics.counter('network_bytes_total', 'Downloaded bytes').inc(len(content))
+    return content
+
+class Response(object):
+    '''
+    Completely read HTTP response, file-like (subset of the urllib2
+    response interface).
+    '''
+    def __init__(self, url, code, msg, headers, content):
+        from cStringIO import StringIO
+        self.url = url
+        self.code = code
+        self.msg = msg
+        self.headers = headers
+        self.content = content
+        self.fp = StringIO(content)
+
+    def read(self, *args):
+        return self.fp.read(*args)
+
+    def close(self):
+        pass
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.code
+
+class ConnectionPool(object):
+    '''
+    Persistent (keep-alive) HTTP and HTTPS connections, reused per
+    (scheme, host, port). Thread-safe, every request takes a connection out
+    of the pool for its duration.
+    '''
+    def __init__(self, maxidle=8):
+        import threading
+        self.maxidle = maxidle
+        self.idle = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, timeout, fresh=False):
+        '''
+        Returns a (connection, reused) tuple. With fresh=True, idle
+        connections to this host are discarded and a new one is opened.
+        '''
+        import httplib
+
+        with self.lock:
+            connections = self.idle.get(key)
+            if fresh:
+                for conn in self.idle.pop(key, ()):
+                    conn.close()
+            elif connections:
+                conn = connections.pop()
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+
+        scheme, host, port = key
+        if scheme == 'https':
+            return httplib.HTTPSConnection(host, port, timeout=timeout), False
+        return httplib.HTTPConnection(host, port, timeout=timeout), False
+
+    def put(self, key, conn):
+        with self.lock:
+            connections = self.idle.setdefault(key, [])
+            if len(connections) < self.maxidle:
+                connections.append(conn)
+                return
+        conn.close()
+
+    def clear(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def request(self, url, headers=None, method='GET', timeout=None):
+        '''
+        Send a single request (no redirect handling). Returns a Response.
+
+        The timeout applies to connecting as well as to every read. A
+        connection which was closed by the server while idle is detected and
+        the request is repeated once with a new connection (other idle
+        connections to the host are dropped as well, they are likely stale
+        too).
+        '''
+        import socket
+        import httplib
+        from urlparse import urlsplit
+
+        r = urlsplit(url)
+        key = (r.scheme, r.hostname, r.port)
+        path = r.path or '/'
+        if r.query:
+            path += '?' + r.query
+
+        headers = dict(headers or {})
+        headers.setdefault('Host', r.netloc.rpartition('@')[2])
+        headers.setdefault('User-Agent', 'PyMOL-Plugins')
+
+        for attempt in (0, 1):
+            conn, reused = self.get(key, timeout, attempt > 0)
+            try:
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+                content = response.read()
+            except (httplib.HTTPException, socket.error) as e:
+                conn.close()
+                if reused and attempt == 0 and not isinstance(e, socket.timeout):
+                    continue
+                raise URLError(e)
+            break
+
+        if response.will_close:
+            conn.close()
+        else:
+            self.put(key, conn)
+
+        return Response(url, response.status, response.reason, response.msg,
+                content)
+
+_pool = ConnectionPool()
+
+redirect_codes = (301, 302, 303, 307, 308)
+
+def use_proxy(url):
+    '''
+    True if a proxy is configured (environment or system settings) for url.
+    '''
+    import urllib
+    from urlparse import urlsplit
+    r = urlsplit(url)
+    return r.scheme in urllib.getproxies() and not urllib.proxy_bypass(r.hostname)
+
+def http_request(url, headers=None, method='GET', timeout=None):
+    '''
+    HTTP(S) request over a pooled keep-alive connection, follows redirects.
 
-    The timeout does not effect the "urlopen" call itself, that takes 20sec
-    for unavailable urls in my tests. Also "socket.setdefaulttimeout" does
-    not change that.
+    Returns a Response for 2xx and 304 (Not Modified) responses, raises
+    urllib2.HTTPError for error codes and URLError on network failure.
+
+    Requests which have to go through a proxy, and non-HTTP urls, are
+    passed to urllib2 instead.
     '''
-    from urllib2 import urlopen
     from . import pref_get
 
-    timeout = pref_get('network_timeout', 10.0)
-    return urlopen(url, timeout=timeout)
+    if timeout is None:
+        timeout = pref_get('network_timeout', 10.0)
+
+    for _ in range(pref_get('network_max_redirects', 5) + 1):
+        if not url.lower().startswith(('http://', 'https://')) or use_proxy(url):
+            return _urllib2_request(url, headers, timeout)
+
+        response = _pool.request(url, headers, method, timeout)
+
+        if response.code in redirect_codes:
+            from urlparse import urljoin
+            location = response.headers.getheader('location')
+            if not location:
+                break
+            url = urljoin(url, location)
+            if response.code == 303:
+                method = 'GET'
+            continue
+
+        break
+
+    if response.code >= 400 or response.code in redirect_codes:
+        raise urllib2.HTTPError(response.url, response.code, response.msg,
+                response.headers, response.fp)
+
+    return response
+
+def _urllib2_request(url, headers, timeout):
+    request = urllib2.Request(url, headers=headers or {})
+    try:
+        handle = urllib2.urlopen(request, timeout=timeout)
+    except urllib2.HTTPError as e:
+        if e.code != 304:
+            raise
+        return Response(url, 304, e.msg, e.hdrs, '')
+    try:
+        return Response(handle.geturl(), handle.getcode() or 200,
+                getattr(handle, 'msg', ''), handle.info(), handle.read())
+    finally:
+        handle.close()
+
+def urlopen(url, cache=True):
+    '''
+    urlopen replacement which reuses connections (see http_request), with
+    timeout from preferences ("network_timeout"). The timeout covers
+    connecting and reading, but not the host name lookup.
+
+    With cache=True, responses go through the on-disk HTTP cache (see
+    httpcache module).
+
+    Returns a file-like Response object.
+    '''
+    with tracing.span('urlopen ' + url, 'network'):
+        try:
+            if cache and httpcache.is_enabled():
+                content, result = httpcache.cached_request(url, http_request)
+                handle = Response(url, 200, 'OK', _empty_headers(), content)
+            else:
+                handle, result = http_request(url), 'uncached'
+        except IOError:
+            metrics.counter('network_requests_total', 'Repository requests'
+                    ).inc(status='error')
+            raise
+
+    if result in ('hit', 'stale'):
+        status = 'cached'
+    else:
+        status = 'ok'
+        if result != 'revalidated':
+            count_download(handle.content)
+    metrics.counter('network_requests_total', 'Repository requests'
+            ).inc(status=status)
+    return handle
+
+def _empty_headers():
+    import mimetools
+    from cStringIO import StringIO
+    return mimetools.Message(StringIO(''))
+
+class IndexEntry(str):
+    '''
+    Repository listing item: the filename (a string, so it can be used
+    wherever a filename is expected) with information from the structured
+    index (pluginindex.json). Unknown fields are None.
+
+    name:       plugin (module) name
+    version:    version string ("Version" metadata)
+    size:       file size in bytes
+    sha256:     hex digest of the file content
+    mtime:      last-modified time (seconds since epoch)
+    metadata:   dictionary of header metadata
+    docstring:  module docstring
+    '''
+    fields = ('name', 'version', 'size', 'sha256', 'mtime', 'metadata',
+            'docstring')
+
+    def __new__(cls, filename, **kwargs):
+        self = str.__new__(cls, filename)
+        for key in cls.fields:
+            setattr(self, key, kwargs.get(key))
+        if self.name is None:
+            from .installation import get_name_and_ext, BadInstallationFile
+            try:
+                self.name = get_name_and_ext(filename)[0]
+            except BadInstallationFile:
+                pass
+        return self
+
+    def get_plugin_info(self):
+        '''
+        Returns a temporary PluginInfo instance with metadata and docstring
+        from the index (for the info dialog, without downloading the file).
+        '''
+        from . import PluginInfo
+        info = PluginInfo(self.name, self)
+        record = info.get_index_record()
+        record['metadata'] = self.metadata or {}
+        record['docstring'] = self.docstring
+        return info
+
+def parse_index_json(content):
+    '''
+    Parse pluginindex.json content. Layout:
+
+    {"version": 1, "plugins": [{"filename": "foo.py", "name": "foo",
+        "version": "1.0", "size": 123, "sha256": "...", "mtime": 1.3e9,
+        "metadata": {...}, "docstring": "..."}, ...]}
+
+    Returns a list of IndexEntry. Raises ValueError for invalid content.
+    '''
+    import json
+    from . import _str_recursive
+
+    data = _str_recursive(json.loads(content))
+    if not isinstance(data, dict) or data.get('version') != INDEX_VERSION:
+        raise ValueError('unsupported index version')
+
+    entries = []
+    for item in data.get('plugins', ()):
+        filename = item.get('filename')
+        if not filename:
+            continue
+        kwargs = dict((key, item.get(key)) for key in IndexEntry.fields)
+        entries.append(IndexEntry(filename, **kwargs))
+    return entries
 
 class Repository():
     '''
@@ -37,7 +329,8 @@ class Repository():
 
     def list(self):
         '''
-        Return a list of filenames
+        Return a list of filenames (IndexEntry instances if the repository
+        has a structured index)
         '''
         try:
             return self.list_indexfile()
@@ -45,9 +338,17 @@ class Repository():
             return self.list_scan()
 
     def list_indexfile(self):
+        try:
+            return self.list_indexjson()
+        except (IOError, ValueError):
+            pass
         s = self.retrieve('pluginindex.txt')
         return s.splitlines()
 
+    def list_indexjson(self):
+        entries = parse_index_json(self.retrieve('pluginindex.json'))
+        return filter(self.is_supported, entries)
+
     def list_scan(self):
         raise NotImplementedError
 
@@ -57,6 +358,55 @@ class Repository():
         '''
         raise NotImplementedError
 
+    def retrieve_many(self, names, threads=None):
+        '''
+        Retrieve several files concurrently (number of threads from the
+        "network_threads" preference). Connections are reused.
+
+        Returns a list of (name, content, error) tuples in the order of
+        names, content is None and error the exception on failure.
+        '''
+        from . import pref_get
+
+        def retrieve(name):
+            try:
+                return (name, self.retrieve(name), None)
+            except (IOError, ValueError) as e:
+                return (name, None, e)
+
+        names = list(names)
+        threads = int(threads or pref_get('network_threads', 8))
+        if threads < 2 or len(names) < 2:
+            return map(retrieve, names)
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(min(threads, len(names)))
+        try:
+            return pool.map(retrieve, names)
+        finally:
+            pool.close()
+
+    def retrieve_header(self, name):
+        '''
+        Get metadata and docstring of a python plugin file, returns a
+        (metadata, docstring) tuple.
+        '''
+        return parse_header(self.retrieve(name))[:2]
+
+    def get_plugin_info(self, name):
+        '''
+        Returns a temporary PluginInfo instance for the info dialog, with
+        metadata and docstring from the index or from the file header
+        (python files only, archives need to be downloaded), or None.
+        '''
+        if getattr(name, 'metadata', None) is not None:
+            return name.get_plugin_info()
+        if not name.endswith('.py'):
+            return None
+        metadata, docstring = self.retrieve_header(name)
+        return IndexEntry(name, metadata=metadata,
+                docstring=docstring).get_plugin_info()
+
     def copy(self, name, dst):
         '''
         Copy file. The destination may be a directory.
@@ -67,10 +417,23 @@ class Repository():
             dst = os.path.join(dst, os.path.basename(name))
 
         content = self.retrieve(name)
+        self.verify(name, content)
         f = open(dst, 'w')
         f.write(content)
         f.close()
 
+    def verify(self, name, content):
+        '''
+        Check content against the checksum from the index (if name is an
+        IndexEntry with sha256). Raises IOError on mismatch.
+        '''
+        sha256 = getattr(name, 'sha256', None)
+        if not sha256:
+            return
+        import hashlib
+        if hashlib.sha256(content).hexdigest() != sha256:
+            raise IOError('checksum mismatch for ' + name)
+
     def is_supported(self, name):
         if len(name) == 0 or name[0] in ['.', '_']:
             return False
@@ -92,8 +455,9 @@ class HttpRepository(Repository):
         import re
 
         # fetch as string
-        handle = urlopen(self.url)
-        content = handle.read()
+        with tracing.span('list ' + self.url, 'network'):
+            handle = urlopen(self.url)
+            content = handle.read()
 
         # clear comments
         re_comment = re.compile(r'<!\s*--.*?--\s*>', re.DOTALL)
@@ -119,12 +483,111 @@ class HttpRepository(Repository):
 
     def retrieve(self, name):
         url = self.get_full_url(name)
-        handle = urlopen(url)
-        content = handle.read()
-        handle.close()
+        with tracing.span('retrieve ' + url, 'network'):
+            handle = urlopen(url)
+            content = handle.read()
+            handle.close()
 
         return content
 
+    def retrieve_header(self, name):
+        '''
+        Get metadata and docstring of a python plugin file with HTTP range
+        requests: Fetches the first "header_fetch_size" bytes (preference,
+        default 4096) and extends the range until the metadata block and
+        the docstring are complete. Falls back to the full file if the
+        server does not support ranges.
+
+        Uses the HTTP cache: A fresh cached copy of the whole file is parsed
+        directly. Otherwise the parsed header is cached (with the validators
+        of the response) and revalidated with a conditional request.
+        '''
+        import json
+        from . import _str_recursive
+
+        url = self.get_full_url(name)
+        if not httpcache.is_enabled():
+            return self.fetch_header(name)[:2]
+
+        entry = httpcache.lookup_fresh(url)
+        if entry is not None:
+            return parse_header(entry.content)[:2]
+
+        key = 'header:' + url
+        entry = httpcache.lookup_fresh(key)
+        if entry is None:
+            entry = httpcache.lookup(key)
+            headers = entry.get_conditional_headers() if entry is not None else {}
+            metadata, docstring, response = self.fetch_header(name, headers)
+            if response is None:
+                return metadata, docstring
+            if response.code != 304:
+                try:
+                    httpcache.store(key, response,
+                            json.dumps([metadata, docstring]))
+                except ValueError:
+                    # not utf-8 encoded
+                    pass
+                return metadata, docstring
+            httpcache.refresh(entry)
+
+        metadata, docstring = _str_recursive(json.loads(entry.content))
+        return metadata, docstring
+
+    def fetch_header(self, name, headers=None):
+        '''
+        Network part of retrieve_header, "headers" are added to the first
+        request (conditional request headers).
+
+        Returns (metadata, docstring, response), with the first response
+        (metadata and docstring are None if it's 304 Not Modified), or None
+        for the response if the file was retrieved with a plain GET.
+        '''
+        from . import pref_get
+
+        url = self.get_full_url(name)
+        size = pref_get('header_fetch_size', 4096)
+        content = ''
+        first = None
+
+        with tracing.span('retrieve_header ' + url, 'network'):
+            while True:
+                request_headers = dict(headers or {}) if first is None else {}
+                request_headers['Range'] = 'bytes=%d-%d' % (len(content),
+                        len(content) + size - 1)
+                try:
+                    response = http_request(url, request_headers)
+                except urllib2.HTTPError as e:
+                    # 416: Range Not Satisfiable (e.g. empty file)
+                    if e.code != 416:
+                        raise
+                    return parse_header(self.retrieve(name))[:2] + (None,)
+
+                metrics.counter('network_requests_total', 'Repository requests'
+                        ).inc(status='ok')
+                count_download(response.content)
+
+                if first is None:
+                    first = response
+                    if response.code == 304:
+                        return None, None, response
+
+                if response.code != 206:
+                    # server ignored the range
+                    return parse_header(response.content)[:2] + (first,)
+
+                content += response.content
+                total = response.headers.getheader('content-range', ''
+                        ).rpartition('/')[2]
+                complete = not response.content or (total.isdigit() and
+                        len(content) >= int(total))
+
+                metadata, docstring, done = parse_header(content, complete)
+                if done:
+                    return metadata, docstring, first
+
+                size *= 4
+
 class GithubRepository(HttpRepository):
     '''
     http://developer.github.com/v3/
@@ -168,8 +631,9 @@ class GithubRepository(HttpRepository):
     list = list_scan
 
     def fetchjson(self, url):
-        handle = urlopen('https://api.github.com' + url)
-        return eval(handle.read())
+        with tracing.span('fetchjson ' + url, 'network'):
+            handle = urlopen('https://api.github.com' + url)
+            return eval(handle.read())
 
 class LocalRepository(Repository):
     def __init__(self, url):
@@ -192,6 +656,9 @@ class LocalRepository(Repository):
     def copy(self, name, dst):
         import shutil
         url = self.get_full_url(name)
+        if getattr(name, 'sha256', None):
+            Repository.copy(self, name, dst)
+            return
         shutil.copy(url, dst)
 
     def get_full_url(self, name):
@@ -275,8 +742,9 @@ ARGUMENTS
 
         # get page content
         try:
-            handle = urlopen(url)
-            content = handle.read()
+            with tracing.span('fetchscript ' + url, 'network'):
+                handle = urlopen(url)
+                content = handle.read()
         except IOError as e:
             print "Plugin-Error: %s" % e
             return
@@ -0,0 +1,222 @@
+'''
+PyMOL Plugins Engine, Tracing
+
+Timed spans for the plugin lifecycle (directory scans, metadata parsing,
+imports, initialization, menu items, preference saving, network requests).
+Spans are passed to registered hooks, and can be recorded and exported in
+the Chrome trace event format (load in chrome://tracing or Perfetto).
+
+Usage:
+
+    from pymolplugins import tracing
+    with tracing.span('my step', 'category', key='value'):
+        ...
+
+Spans cost next to nothing if no hook is registered.
+
+License: BSD-2-Clause
+
+'''
+
+import os
+import time
+import threading
+
+# callables which take an event dictionary (Chrome trace event format)
+_hooks = []
+
+def add_hook(func):
+    if func not in _hooks:
+        _hooks.append(func)
+
+def remove_hook(func):
+    if func in _hooks:
+        _hooks.remove(func)
+
+def is_enabled():
+    return bool(_hooks)
+
+def emit(event):
+    for func in list(_hooks):
+        func(event)
+
+class span(object):
+    '''
+    Context manager for a timed span ("complete" event).
+    '''
+    __slots__ = ['name', 'cat', 'args', 'start']
+
+    def __init__(self, name, cat='plugins', **args):
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        if _hooks:
+            self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.start is None or not _hooks:
+            return
+        if exc_type is not None:
+            self.args['error'] = exc_type.__name__
+        _emit_complete(self.name, self.cat, self.start, self.args)
+
+def _emit_complete(name, cat, start, args):
+    end = time.time()
+    emit({
+        'name': name,
+        'cat': cat,
+        'ph': 'X',
+        'ts': start * 1e6,
+        'dur': (end - start) * 1e6,
+        'pid': os.getpid(),
+        'tid': threading.current_thread().ident,
+        'args': args,
+    })
+
+class ChromeTraceRecorder(object):
+    '''
+    Hook which records events, and writes them as Chrome trace JSON.
+
+    If imports=True, every module import (not only plugins) gets its own
+    span, which shows nested imports in the timeline.
+    '''
+    def __init__(self, imports=False):
+        self.events = []
+        self.threads = {}
+        self.imports = imports
+        self._import_orig = None
+
+    def __call__(self, event):
+        thread = threading.current_thread()
+        self.threads[thread.ident] = thread.name
+        self.events.append(event)
+
+    def start(self):
+        add_hook(self)
+        if self.imports:
+            self._wrap_import()
+
+    def stop(self):
+        remove_hook(self)
+        if self._import_orig is not None:
+            import __builtin__
+            __builtin__.__import__ = self._import_orig
+            self._import_orig = None
+
+    def _wrap_import(self):
+        import sys
+        import __builtin__
+
+        import_orig = self._import_orig = __builtin__.__import__
+
+        def import_traced(name, globals=None, locals=None, fromlist=None, level=-1):
+            # only report imports which actually loaded modules
+            nmodules = len(sys.modules)
+            start = time.time()
+            try:
+                return import_orig(name, globals, locals, fromlist, level)
+            finally:
+                if len(sys.modules) != nmodules and _hooks:
+                    if not name and fromlist:
+                        name = ', '.join(fromlist)
+                    if level > 0:
+                        name = '.' * level + name
+                    _emit_complete(name, 'import', start, {})
+
+        __builtin__.__import__ = import_traced
+
+    def get_trace(self):
+        pid = os.getpid()
+        meta = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+            'args': {'name': name}} for (tid, name) in self.threads.items()]
+        return {
+            'traceEvents': meta + self.events,
+            'displayTimeUnit': 'ms',
+        }
+
+    def write(self, filename):
+        import json
+        f = open(filename, 'w')
+        json.dump(self.get_trace(), f)
+        f.close()
+
+_recorder = None
+
+def start_trace(imports=False):
+    '''
+    Start recording spans.
+    '''
+    global _recorder
+    if _recorder is None:
+        _recorder = ChromeTraceRecorder(imports)
+        _recorder.start()
+
+def stop_trace(filename=None):
+    '''
+    Stop recording and write trace to filename (if given).
+
+    Returns the number of recorded events.
+    '''
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is None:
+        return 0
+    recorder.stop()
+    if filename:
+        recorder.write(filename)
+    return len(recorder.events)
+
+def trace_startup(filename, imports=False):
+    '''
+    Start recording now and write the trace on exit. Called on import of the
+    plugin engine if the "trace_file" preference is set.
+    '''
+    import atexit
+    start_trace(imports)
+    atexit.register(stop_trace, filename)
+
+def plugin_trace(action='start', filename='', imports=0, quiet=0):
+    '''
+DESCRIPTION
+
+    Record a timeline of plugin engine activity (directory scans, metadata
+    parsing, imports, initialization, menu items, preference saving,
+    network requests) and save it in Chrome trace event format, which can
+    be viewed in chrome://tracing or https://ui.perfetto.dev
+
+    To trace PyMOL startup, set the "trace_file" preference:
+    PyMOL> python
+    import pymolplugins
+    pymolplugins.pref_set('trace_file', '~/pymol-trace.json')
+    python end
+
+USAGE
+
+    plugin_trace start [, imports=0/1 ]
+
+    plugin_trace stop, filename
+
+ARGUMENTS
+
+    imports = 0/1: record a span for every module import {default: 0}
+    '''
+    from pymol import cmd
+
+    if action == 'start':
+        start_trace(int(imports))
+        if not int(quiet):
+            print ' Tracing started'
+    elif action == 'stop':
+        if filename:
+            filename = cmd.exp_path(filename)
+        n = stop_trace(filename)
+        if not int(quiet):
+            print ' Tracing stopped, %d events recorded' % (n)
+    else:
+        print ' Error: action must be "start" or "stop"'
+
+# vi:expandtab:smarttab:sw=4
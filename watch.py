@@ -0,0 +1,149 @@
+'''
+PyMOL Plugins Engine, Plugin Watcher
+
+Polls the source files of loaded plugins and reloads plugins whose sources
+changed (see PluginInfo.reload). Meant for plugin development.
+
+License: BSD-2-Clause
+
+'''
+
+_timer = None
+_interval = 1.0
+
+def get_changed_plugins():
+    '''
+    Returns a list of loaded plugins (PluginInfo) with changed source files.
+    '''
+    from . import plugins
+    return [info for info in plugins.values()
+            if info.loaded and info.get_changed_modules()]
+
+def reload_changed(quiet=1):
+    '''
+    Reload all loaded plugins with changed source files.
+
+    Returns the list of reloaded plugins.
+    '''
+    from . import sortPluginsByRequires
+
+    infos = get_changed_plugins()
+
+    # required plugins first
+    for group in sortPluginsByRequires(infos, reloading=True):
+        for info in group:
+            info.reload()
+            if not int(quiet):
+                print ' Reloaded plugin "%s"' % (info.name)
+
+    return infos
+
+def _poll():
+    global _timer
+
+    if _timer is None:
+        return
+
+    try:
+        reload_changed()
+    finally:
+        if _timer is not None:
+            _schedule()
+
+def _schedule():
+    '''
+    Schedule next poll. Use the Tk event loop if available (plugin
+    initialization usually needs to run in the Tk thread), otherwise a
+    timer thread.
+    '''
+    global _timer
+    from .legacysupport import get_pmgapp
+
+    root = getattr(get_pmgapp(), 'root', None)
+    if root is not None:
+        _timer = root.after(int(_interval * 1000), _poll)
+    else:
+        import threading
+        _timer = threading.Timer(_interval, _poll)
+        _timer.setDaemon(1)
+        _timer.start()
+
+def start_watching(interval=1.0):
+    '''
+    Start polling for changed plugin sources every "interval" seconds.
+    '''
+    global _interval
+    _interval = float(interval)
+    if _timer is None:
+        _schedule()
+
+def stop_watching():
+    global _timer
+    timer, _timer = _timer, None
+    if hasattr(timer, 'cancel'):
+        timer.cancel()
+    elif timer is not None:
+        from .legacysupport import get_pmgapp
+        get_pmgapp().root.after_cancel(timer)
+
+def is_watching():
+    return _timer is not None
+
+def plugin_watch(state=1, interval=1.0, quiet=0):
+    '''
+DESCRIPTION
+
+    Watch the source files of loaded plugins and reload plugins when their
+    sources change. Commands and menu items of the old version are removed
+    before reloading.
+
+USAGE
+
+    plugin_watch [ state [, interval ]]
+
+ARGUMENTS
+
+    state = on/off {default: on}
+
+    interval = float: polling interval in seconds {default: 1.0}
+    '''
+    if str(state).lower() in ('0', 'off', 'false', 'no'):
+        stop_watching()
+        if not int(quiet):
+            print ' Stopped watching plugins'
+    else:
+        start_watching(interval)
+        if not int(quiet):
+            print ' Watching plugins (interval %.1f seconds)' % (_interval)
+
+def plugin_reload(name='', force=0, quiet=0):
+    '''
+DESCRIPTION
+
+    Reload a loaded plugin. Only modules with changed sources (and modules
+    which depend on them) are reloaded, unless force=1.
+
+USAGE
+
+    plugin_reload [ name [, force ]]
+
+ARGUMENTS
+
+    name = string: plugin name {default: all plugins with changed sources}
+    '''
+    from . import plugins
+
+    if not name:
+        infos = reload_changed(quiet)
+        if not infos and not int(quiet):
+            print ' No changed plugins'
+        return
+
+    if name not in plugins:
+        print ' Error: no such plugin'
+        return
+
+    if plugins[name].reload(force=int(force)) and not int(quiet):
+        print ' Reloaded plugin "%s"' % (name)
+
+# vi:expandtab:smarttab:sw=4